@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+Offer parsing throughput of the service scrapers.
+
+rds, cache, redshift and opensearch scrape() take an input_file, a saved Price
+List offer file to parse instead of downloading the current one. This runs each
+of them on offer files of growing size, synthetic ones (see synthetic.py) and/or
+saved ones given with --offer, each in a fresh process, and reports:
+
+- input_mb_per_s: MB of offer file parsed per second of scrape()
+- skus_per_s: instance SKUs selected and joined with their terms per second
+- parse: the part of the wall time spent in the offer file parser
+- peak RSS and the size of the instances.json written
+
+The documentation pages and AWS API calls the scrapers add their details from
+are not part of the parsing and are skipped, unless --enrich is given (e.g.
+together with REPLAY_MODE=replay).
+
+Results are saved as JSON (-o), and --compare prints the change against an
+earlier results file, to compare commits:
+
+    python benchmarks/parser_bench.py --scales 1,2,4 -o before.json
+    python benchmarks/parser_bench.py --scales 1,2,4 --compare before.json
+    python benchmarks/parser_bench.py --offer rds=/tmp/AmazonRDS.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import instrument
+import synthetic
+
+# Version of the results file layout
+FORMAT = 1
+
+# Scraper module -> service code of its offer file, network-bound enrichment
+SERVICES = {
+    "rds": ("AmazonRDS", ["add_ebs_info"]),
+    "cache": ("AmazonElastiCache", ["add_cache_parameters"]),
+    "redshift": ("AmazonRedshift", ["add_node_parameters"]),
+    "opensearch": ("AmazonES", ["add_volume_quotas"]),
+}
+
+
+class _ParseTimer(object):
+    """Counts the offer file events read by OfferReader and the time spent"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.events = {}
+
+    def wrap(self, next_event):
+        def wrapper(reader):
+            start = time.perf_counter()
+            event = next_event(reader)
+            self.seconds += time.perf_counter() - start
+            if event is not None:
+                self.events[event[0]] = self.events.get(event[0], 0) + 1
+            return event
+
+        return wrapper
+
+
+def run_one(service, input_file, workdir, enrich):
+    """scrape() input_file with the scraper of service, return measurements"""
+    import offers
+
+    module = importlib.import_module(service)
+    if not enrich:
+        for name in SERVICES[service][1]:
+            setattr(module, name, lambda instances: None)
+    timer = _ParseTimer()
+    offers.OfferReader._next = timer.wrap(offers.OfferReader._next)
+
+    output_file = os.path.join(workdir, "instances.json")
+    with instrument.stage(service) as record:
+        module.scrape(output_file, input_file)
+
+    with open(output_file) as f:
+        instance_types = len(json.load(f))
+    input_bytes = os.path.getsize(input_file)
+    skus = timer.events.get("product", 0)
+    return {
+        "service": service,
+        "input": os.path.basename(input_file),
+        "input_bytes": input_bytes,
+        "wall": record["wall"],
+        "cpu": record["cpu"],
+        "parse": round(timer.seconds, 3),
+        "input_mb_per_s": round(input_bytes / 1e6 / record["wall"], 3),
+        "skus": skus,
+        "term_skus": timer.events.get("OnDemand", 0) + timer.events.get("Reserved", 0),
+        "skus_per_s": round(skus / record["wall"], 1),
+        "instance_types": instance_types,
+        "output_bytes": os.path.getsize(output_file),
+        "peak_rss_kb": instrument.report()["peak_rss_kb"],
+        "peak_rss_delta_kb": record["peak_rss_delta_kb"],
+    }
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results, baseline=None):
+    columns = [
+        ("service", "service", "%s"),
+        ("input", "input", "%s"),
+        ("MB", "input_bytes", None),
+        ("wall s", "wall", "%.2f"),
+        ("parse s", "parse", "%.2f"),
+        ("MB/s", "input_mb_per_s", "%.1f"),
+        ("SKUs/s", "skus_per_s", "%.0f"),
+        ("peak MiB", "peak_rss_kb", None),
+        ("out KiB", "output_bytes", None),
+    ]
+    previous = {}
+    for r in (baseline or {}).get("results", []):
+        previous[(r["service"], r["input"])] = r
+
+    header = [title for title, _, _ in columns]
+    if baseline:
+        header += ["MB/s vs base", "peak vs base"]
+    rows = [header]
+    for r in results:
+        row = []
+        for _, key, fmt in columns:
+            if key == "input_bytes":
+                row.append("%.1f" % (r[key] / 1e6))
+            elif key == "peak_rss_kb":
+                row.append("%.0f" % (r[key] / 1024))
+            elif key == "output_bytes":
+                row.append("%.0f" % (r[key] / 1024))
+            else:
+                row.append(fmt % r[key])
+        if baseline:
+            before = previous.get((r["service"], r["input"]))
+            if before:
+                row.append(
+                    "%+.1f%%"
+                    % (100.0 * r["input_mb_per_s"] / before["input_mb_per_s"] - 100)
+                )
+                row.append(
+                    "%+.1f%%" % (100.0 * r["peak_rss_kb"] / before["peak_rss_kb"] - 100)
+                )
+            else:
+                row += ["-", "-"]
+        rows.append(row)
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    for row in rows:
+        print(
+            "  ".join(
+                cell.ljust(w) if i < 2 else cell.rjust(w)
+                for i, (cell, w) in enumerate(zip(row, widths))
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "--services",
+        default=",".join(SERVICES),
+        help="comma separated, default all of " + ", ".join(SERVICES),
+    )
+    parser.add_argument(
+        "--scales",
+        default="1,2",
+        help="synthetic offer file scales, comma separated, empty for none",
+    )
+    parser.add_argument(
+        "--offer",
+        action="append",
+        default=[],
+        metavar="SERVICE=PATH",
+        help="also run SERVICE on a saved offer file, can be repeated",
+    )
+    parser.add_argument("--enrich", action="store_true")
+    parser.add_argument("-o", "--output", help="write the results as JSON here")
+    parser.add_argument("--compare", help="results JSON of an earlier run")
+    parser.add_argument("--verbose", action="store_true", help="show scrape output")
+    # Internal: measure one run in this process
+    parser.add_argument("--child", nargs=3, metavar=("SERVICE", "INPUT", "OUT"))
+    args = parser.parse_args()
+
+    if args.child:
+        service, input_file, out = args.child
+        workdir = tempfile.mkdtemp(prefix="parser-bench-")
+        try:
+            result = run_one(service, input_file, workdir, args.enrich)
+        finally:
+            shutil.rmtree(workdir)
+        with open(out, "w") as f:
+            json.dump(result, f)
+        return
+
+    services = [s for s in args.services.split(",") if s]
+    for service in services:
+        if service not in SERVICES:
+            parser.error("unknown service {!r}".format(service))
+    scales = [float(s) for s in args.scales.split(",") if s]
+    runs = []
+    for offer in args.offer:
+        service, _, path = offer.partition("=")
+        if service not in SERVICES or not path:
+            parser.error("--offer needs SERVICE=PATH, not {!r}".format(offer))
+        runs.append((service, os.path.abspath(path), None))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    offer_dir = tempfile.mkdtemp(prefix="parser-bench-offers-")
+    try:
+        for service in services:
+            for scale in scales:
+                path = os.path.join(
+                    offer_dir, "synthetic-{}-{:g}x.json".format(service, scale)
+                )
+                runs.append((service, path, scale))
+
+        env = dict(os.environ, TQDM_DISABLE="1")
+        results = []
+        for service, path, scale in runs:
+            if scale is not None:
+                print("Generating {} offer file, scale {:g}x...".format(service, scale))
+                with open(path, "w") as f:
+                    synthetic.write_offer_file(f, SERVICES[service][0], scale)
+            print("Scraping {} from {}...".format(service, os.path.basename(path)))
+            with tempfile.NamedTemporaryFile(suffix=".json") as out:
+                cmd = [sys.executable, os.path.abspath(__file__)]
+                cmd += ["--child", service, path, out.name]
+                if args.enrich:
+                    cmd.append("--enrich")
+                subprocess.run(
+                    cmd,
+                    check=True,
+                    cwd=ROOT,
+                    env=env,
+                    stdout=None if args.verbose else subprocess.DEVNULL,
+                )
+                with open(out.name) as f:
+                    result = json.load(f)
+            result["scale"] = scale
+            results.append(result)
+            if scale is not None:
+                os.unlink(path)
+    finally:
+        shutil.rmtree(offer_dir)
+
+    print_table(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "format": FORMAT,
+                    "commit": _commit(),
+                    "python": platform.python_version(),
+                    "enrich": args.enrich,
+                    "results": results,
+                },
+                f,
+                indent=1,
+                sort_keys=True,
+            )
+        print("Results written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
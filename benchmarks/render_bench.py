@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+"""
+Render benchmark on synthetic EC2 catalogs of growing size.
+
+For each scale a synthetic www/instances.json (see synthetic.py) is rendered
+with render.render() in a scratch directory, in a fresh process so the peak RSS
+of one scale does not hide the next. The phases render() goes through are
+timed by wrapping the module functions it calls:
+
+- load: json.load() of instances.json
+- regions_list
+- build_detail_pages_ec2
+- per_region_pricing, which includes
+- compress_pricing and compress_instance_azs (summed over all regions)
+- template: mako rendering, of in/index.html.mako and of each detail page
+
+Each phase reports wall time, CPU time, calls and peak RSS growth, and each
+scale the bytes written to the detail pages, per-region files and index.html.
+
+    python benchmarks/render_bench.py --scales 1,4,16 -o render_bench.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import instrument
+import synthetic
+
+PHASES = [
+    "load",
+    "regions_list",
+    "build_detail_pages_ec2",
+    "per_region_pricing",
+    "compress_pricing",
+    "compress_instance_azs",
+    "template",
+    "render",
+]
+
+
+def _timed(name, func):
+    def wrapper(*args, **kwargs):
+        with instrument.stage(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _dir_bytes(path, match=lambda name: True):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            if match(name):
+                total += os.path.getsize(os.path.join(dirpath, name))
+    return total
+
+
+def _phases():
+    """Sum the instrument records of each phase"""
+    phases = {}
+    for record in instrument.report()["stages"]:
+        phase = phases.setdefault(
+            record["name"],
+            {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_rss_delta_kb": 0},
+        )
+        phase["calls"] += 1
+        phase["wall"] = round(phase["wall"] + record["wall"], 3)
+        phase["cpu"] = round(phase["cpu"] + record["cpu"], 3)
+        phase["peak_rss_delta_kb"] = max(
+            phase["peak_rss_delta_kb"], record["peak_rss_delta_kb"]
+        )
+    return phases
+
+
+def run_one(scale, region_scale, workdir, detail_pages):
+    """Render one synthetic catalog in workdir and return its measurements"""
+    for name in ("in", "meta"):
+        os.symlink(os.path.join(ROOT, name), os.path.join(workdir, name))
+    os.makedirs(os.path.join(workdir, "www", "aws", "ec2"))
+    data_file = os.path.join("www", "instances.json")
+
+    instances = synthetic.generate(scale, region_scale)
+    with open(os.path.join(workdir, data_file), "w") as f:
+        json.dump(instances, f, indent=1, sort_keys=True, separators=(",", ": "))
+    instance_types = len(instances)
+    regions = len(synthetic.synthetic_regions(region_scale))
+    del instances
+
+    os.chdir(workdir)
+    import mako.template
+    import render
+
+    render.json = _JSONTimer(render.json)
+    for name in (
+        "regions_list",
+        "build_detail_pages_ec2",
+        "per_region_pricing",
+        "compress_pricing",
+        "compress_instance_azs",
+    ):
+        setattr(render, name, _timed(name, getattr(render, name)))
+    mako.template.Template.render = _timed("template", mako.template.Template.render)
+
+    with instrument.stage("render"):
+        render.render(data_file, "in/index.html.mako", "www/index.html", detail_pages)
+
+    return {
+        "scale": scale,
+        "region_scale": region_scale,
+        "instance_types": instance_types,
+        "regions": regions,
+        "input_bytes": os.path.getsize(data_file),
+        "output_bytes": {
+            "detail_pages": _dir_bytes(os.path.join("www", "aws")),
+            "per_region": _dir_bytes(
+                "www",
+                lambda n: n.startswith(("pricing_", "instance_azs_")),
+            ),
+            "index_html": os.path.getsize(os.path.join("www", "index.html")),
+        },
+        "peak_rss_kb": instrument.report()["peak_rss_kb"],
+        "phases": _phases(),
+    }
+
+
+class _JSONTimer(object):
+    """The json module, with load() timed as the "load" phase"""
+
+    def __init__(self, module):
+        self._module = module
+        self.load = _timed("load", module.load)
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+
+def print_table(results):
+    header = ["scale", "types", "regions"] + PHASES + ["peak MiB", "out MiB"]
+    rows = [header]
+    for r in results:
+        out = sum(r["output_bytes"].values())
+        rows.append(
+            ["%gx/%gx" % (r["scale"], r["region_scale"]), str(r["instance_types"])]
+            + [str(r["regions"])]
+            + [
+                "%.2f" % r["phases"][p]["wall"] if p in r["phases"] else "-"
+                for p in PHASES
+            ]
+            + ["%.0f" % (r["peak_rss_kb"] / 1024), "%.1f" % (out / 1024**2)]
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    print("Wall seconds per phase:")
+    for row in rows:
+        print("  ".join(cell.rjust(w) for cell, w in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--scales", default="1,4", help="comma separated, e.g. 1,4,16")
+    parser.add_argument(
+        "--region-scales",
+        default=None,
+        help="region scale for each scale, defaults to the same as --scales",
+    )
+    parser.add_argument("--no-detail-pages", action="store_true")
+    parser.add_argument("-o", "--output", help="write the results as JSON here")
+    parser.add_argument("--verbose", action="store_true", help="show render output")
+    # Internal: measure one scale in this process
+    parser.add_argument("--child", nargs=3, metavar=("SCALE", "REGIONS", "OUT"))
+    args = parser.parse_args()
+
+    if args.child:
+        scale, region_scale, out = args.child
+        workdir = tempfile.mkdtemp(prefix="render-bench-")
+        try:
+            result = run_one(
+                float(scale), float(region_scale), workdir, not args.no_detail_pages
+            )
+        finally:
+            os.chdir(ROOT)
+            shutil.rmtree(workdir)
+        with open(out, "w") as f:
+            json.dump(result, f)
+        return
+
+    scales = [float(s) for s in args.scales.split(",")]
+    region_scales = scales
+    if args.region_scales:
+        region_scales = [float(s) for s in args.region_scales.split(",")]
+        if len(region_scales) != len(scales):
+            parser.error("--region-scales needs one value per scale")
+
+    results = []
+    for scale, region_scale in zip(scales, region_scales):
+        print("Rendering scale {:g}x, regions {:g}x...".format(scale, region_scale))
+        with tempfile.NamedTemporaryFile(suffix=".json") as out:
+            cmd = [sys.executable, os.path.abspath(__file__)]
+            cmd += ["--child", str(scale), str(region_scale), out.name]
+            if args.no_detail_pages:
+                cmd.append("--no-detail-pages")
+            subprocess.run(
+                cmd,
+                check=True,
+                stdout=None if args.verbose else subprocess.DEVNULL,
+            )
+            with open(out.name) as f:
+                results.append(json.load(f))
+
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+        print("Results written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,502 @@
+#!/usr/bin/env python
+"""
+Synthetic EC2 instances.json and Price List offer files for benchmarks.
+
+At scale 1 the catalog has about as many instance types, regions (main, local
+zones and wavelength zones, from meta/regions_aws.yaml), platforms and reserved
+terms as the real one. scale multiplies the number of instance types and
+region_scale the number of regions, so render cost can be measured as AWS grows
+either one. Records have every key scrape.Instance writes and the same pricing
+structure, so they go through render.py and the detail pages like real data.
+
+Offer files of the services with an input_file (RDS, ElastiCache, Redshift and
+OpenSearch) have the same layout as the real ones and attributes enough for
+their scrapers, with scale multiplying the number of instance families.
+
+    python benchmarks/synthetic.py --scale 4 -o /tmp/instances.json
+    python benchmarks/synthetic.py --offer AmazonRDS -o /tmp/rds-offer.json
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# About today's catalog: ~110 families with ~8 sizes each
+BASE_FAMILIES = 110
+SIZES = [
+    ("nano", 2, 0.5),
+    ("micro", 2, 1),
+    ("small", 2, 2),
+    ("medium", 2, 4),
+    ("large", 2, 8),
+    ("xlarge", 4, 16),
+    ("2xlarge", 8, 32),
+    ("4xlarge", 16, 64),
+    ("8xlarge", 32, 128),
+    ("12xlarge", 48, 192),
+    ("16xlarge", 64, 256),
+    ("24xlarge", 96, 384),
+    ("metal", 96, 384),
+]
+SIZES_PER_FAMILY = 8
+FAMILY_CATEGORIES = [
+    "General purpose",
+    "Compute optimized",
+    "Memory optimized",
+    "Storage optimized",
+    "GPU instance",
+]
+PLATFORMS = [
+    "linux",
+    "mswin",
+    "rhel",
+    "sles",
+    "linuxSQL",
+    "linuxSQLWeb",
+    "linuxSQLEnterprise",
+    "mswinSQL",
+    "mswinSQLWeb",
+    "mswinSQLEnterprise",
+    "rhelSQL",
+    "dedicated",
+]
+RESERVED_TERMS = [
+    "yrTerm{}{}.{}".format(years, kind, option)
+    for years in (1, 3)
+    for kind in ("Standard", "Convertible")
+    for option in ("noUpfront", "partialUpfront", "allUpfront")
+]
+NETWORK_PERFORMANCE = [
+    "Low to Moderate",
+    "Up to 5 Gigabit",
+    "Up to 10 Gigabit",
+    "Up to 25 Gigabit",
+    "25 Gigabit",
+    "50 Gigabit",
+    "100 Gigabit",
+]
+# Share of the regions each instance type is offered in
+AVAILABILITY = 0.6
+
+
+def _tag(n):
+    """ "", "b", "c", ..., "z", "ab", ... to tell copies of a region apart"""
+    if n == 0:
+        return ""
+    letters = ""
+    while n:
+        n, r = divmod(n, 26)
+        letters = string.ascii_lowercase[r] + letters
+    return letters
+
+
+def synthetic_regions(region_scale=1.0):
+    """Region code -> name, region_scale times the regions we know of.
+
+    Copies of a region get letters added to their first part ("usb-east-1"), so
+    regions.zone_type() classifies them like the original.
+    """
+    with open(os.path.join(ROOT, "meta", "regions_aws.yaml")) as f:
+        known = yaml.safe_load(f)
+    count = max(1, int(round(len(known) * region_scale)))
+    result = {}
+    copy = 0
+    while len(result) < count:
+        for code, name in known.items():
+            if len(result) == count:
+                break
+            prefix, rest = code.split("-", 1)
+            tag = _tag(copy)
+            result["{}{}-{}".format(prefix, tag, rest)] = (
+                name if not tag else "{} {}".format(name, tag.upper())
+            )
+        copy += 1
+    return result
+
+
+def _pricing(rnd, hourly):
+    pricing = {}
+    for platform in PLATFORMS:
+        if rnd.random() > 0.8:
+            continue
+        factor = 1 + PLATFORMS.index(platform) * 0.15
+        ondemand = round(hourly * factor, 6)
+        pricing[platform] = {
+            "ondemand": str(ondemand),
+            "spot_min": "%.6f" % (ondemand * 0.3),
+            "spot_max": "%.6f" % (ondemand * 0.5),
+            "spot_count": rnd.randint(1, 6),
+            "spot_mean": "%.6f" % (ondemand * 0.4),
+            "spot_p50": "%.6f" % (ondemand * 0.4),
+            "spot_p90": "%.6f" % (ondemand * 0.48),
+            "reserved": {
+                term: "%.6f" % (ondemand * (0.6 if "yrTerm1" in term else 0.4))
+                for term in RESERVED_TERMS
+            },
+        }
+    pricing["emr"] = {"emr": "%.3f" % (hourly * 0.25)}
+    return pricing
+
+
+def _instance(rnd, family, category, size, vcpu, memory, regions):
+    instance_type = "{}.{}".format(family, size)
+    hourly = 0.0116 * vcpu * (1 + rnd.random())
+    offered = [r for r in regions if r == "us-east-1" or rnd.random() < AVAILABILITY]
+    has_storage = rnd.random() < 0.3
+    return {
+        "ECU": "variable" if family.startswith("t") else float(vcpu * 3),
+        "FPGA": 0,
+        "GPU": 1 if category == "GPU instance" else 0,
+        "GPU_memory": 16 if category == "GPU instance" else 0,
+        "GPU_model": "NVIDIA T4" if category == "GPU instance" else None,
+        "arch": ["x86_64"],
+        "availability_zones": {
+            r: ["{}-az{}".format(r, n) for n in range(1, 4)] for r in offered
+        },
+        "base_performance": None,
+        "burst_minutes": None,
+        "clock_speed_ghz": "3.1 GHz",
+        "compute_capability": 0,
+        "ebs_as_nvme": True,
+        "ebs_baseline_bandwidth": 650.0,
+        "ebs_baseline_iops": 3600.0,
+        "ebs_baseline_throughput": 81.25,
+        "ebs_iops": 20000.0,
+        "ebs_max_bandwidth": 4750.0,
+        "ebs_optimized": True,
+        "ebs_throughput": 593.75,
+        "emr": True,
+        "enhanced_networking": True,
+        "family": category,
+        "generation": "current",
+        "instance_type": instance_type,
+        "intel_avx": True,
+        "intel_avx2": True,
+        "intel_avx512": False,
+        "intel_turbo": True,
+        "ipv6_support": True,
+        "linux_virtualization_types": ["HVM"],
+        "memory": float(memory),
+        "network_performance": rnd.choice(NETWORK_PERFORMANCE),
+        "physical_processor": "Intel Xeon Platinum 8375C",
+        "placement_group_support": True,
+        "pretty_name": "{} {}".format(family.upper(), size.capitalize()),
+        "pricing": {r: _pricing(rnd, hourly) for r in offered},
+        "regions": {r: regions[r] for r in offered},
+        "storage": (
+            {
+                "devices": 1,
+                "includes_swap_partition": False,
+                "nvme_ssd": True,
+                "size": 118,
+                "size_unit": "GB",
+                "ssd": True,
+                "storage_needs_initialization": False,
+                "trim_support": True,
+            }
+            if has_storage
+            else None
+        ),
+        "vCPU": vcpu,
+        "vpc": {"ips_per_eni": 15, "max_enis": 4},
+        "vpc_only": True,
+    }
+
+
+def generate(scale=1.0, region_scale=1.0, seed=0):
+    """A list of synthetic instance records"""
+    rnd = random.Random(seed)
+    regions = synthetic_regions(region_scale)
+    instances = []
+    for n in range(max(1, int(round(BASE_FAMILIES * scale)))):
+        # c1, c1a, ..., m2, ... unique and parseable like real family names
+        family = "{}{}{}".format("cmrixtgp"[n % 8], n // 8 % 9 + 1, _tag(n // 72))
+        category = FAMILY_CATEGORIES[n % len(FAMILY_CATEGORIES)]
+        start = rnd.randint(0, len(SIZES) - SIZES_PER_FAMILY)
+        for size, vcpu, memory in SIZES[start : start + SIZES_PER_FAMILY]:
+            instances.append(
+                _instance(rnd, family, category, size, vcpu, memory, regions)
+            )
+    return instances
+
+
+def _rds_attributes(rnd, instance_type):
+    engine, code = rnd.choice(RDS_ENGINES)
+    return {
+        "databaseEngine": engine,
+        "engineCode": code,
+        "deploymentOption": rnd.choice(["Single-AZ", "Multi-AZ"]),
+        "licenseModel": "No license required",
+        "storage": "EBS Only",
+        "processorArchitecture": "64-bit",
+    }
+
+
+def _cache_attributes(rnd, instance_type):
+    return {
+        "cacheEngine": rnd.choice(["Redis", "Memcached", "Valkey"]),
+        "locationType": rnd.choice(["AWS Region"] * 9 + ["AWS Outposts"]),
+    }
+
+
+def _redshift_attributes(rnd, instance_type):
+    return {"usageFamily": "Compute Instance", "storage": "2 TB SSD"}
+
+
+def _opensearch_attributes(rnd, instance_type):
+    return {"storage": "EBS Only"}
+
+
+RDS_ENGINES = [
+    ("MySQL", "2"),
+    ("PostgreSQL", "14"),
+    ("MariaDB", "18"),
+    ("Oracle", "5"),
+    ("SQL Server", "12"),
+    ("Aurora MySQL", "16"),
+    ("Aurora PostgreSQL", "21"),
+]
+
+# Service code -> productFamily of its instances, instance type format,
+# instance families at scale 1, attributes of a SKU. At scale 1 the files are
+# of the order of size of the real ones, a few hundred MB for RDS and tens of
+# MB for the others.
+OFFER_SERVICES = {
+    "AmazonRDS": (
+        "Database Instance",
+        "db.{}.{}",
+        25,
+        _rds_attributes,
+    ),
+    "AmazonElastiCache": (
+        "Cache Instance",
+        "cache.{}.{}",
+        4,
+        _cache_attributes,
+    ),
+    "AmazonRedshift": (
+        "Compute Instance",
+        "{}.{}",
+        1,
+        _redshift_attributes,
+    ),
+    "AmazonES": (
+        "Amazon OpenSearch Service Instance",
+        "{}.{}.search",
+        3,
+        _opensearch_attributes,
+    ),
+}
+# Other SKUs (storage, data transfer, ...) per instance SKU, which the scrapers
+# have to skip over
+OTHER_SKUS = 0.5
+RESERVED_OFFERS = [
+    ("1yr", "No Upfront"),
+    ("1yr", "Partial Upfront"),
+    ("1yr", "All Upfront"),
+    ("3yr", "No Upfront"),
+    ("3yr", "Partial Upfront"),
+    ("3yr", "All Upfront"),
+]
+
+
+def _sku(rnd):
+    return "".join(
+        rnd.choice(string.ascii_uppercase + string.digits) for _ in range(16)
+    )
+
+
+def _dimension(sku, code, rate, description, unit, price):
+    rate_code = "{}.{}.{}".format(sku, code, rate)
+    return rate_code, {
+        "rateCode": rate_code,
+        "description": description,
+        "beginRange": "0",
+        "endRange": "Inf",
+        "unit": unit,
+        "pricePerUnit": {"USD": "%.10f" % price},
+        "appliesTo": [],
+    }
+
+
+def _ondemand_terms(sku, hourly):
+    code = "JRTCKXETXF"
+    rate_code, dimension = _dimension(
+        sku, code, "6YS6EN2CT7", "$%.3f per hour" % hourly, "Hrs", hourly
+    )
+    return {
+        "{}.{}".format(sku, code): {
+            "offerTermCode": code,
+            "sku": sku,
+            "effectiveDate": "2024-03-01T00:00:00Z",
+            "priceDimensions": {rate_code: dimension},
+            "termAttributes": {},
+        }
+    }
+
+
+def _reserved_terms(sku, hourly):
+    terms = {}
+    for n, (length, option) in enumerate(RESERVED_OFFERS):
+        code = "RSV{:07d}".format(n)
+        hours = 8760 * int(length[0])
+        discount = 0.6 if length == "1yr" else 0.4
+        upfront = {"No Upfront": 0, "Partial Upfront": 0.5, "All Upfront": 1}[option]
+        dimensions = dict(
+            [
+                _dimension(
+                    sku,
+                    code,
+                    "6YS6EN2CT7",
+                    "Reserved hourly fee",
+                    "Hrs",
+                    hourly * discount * (1 - upfront),
+                )
+            ]
+        )
+        if upfront:
+            rate_code, dimension = _dimension(
+                sku,
+                code,
+                "2TG2D8R56U",
+                "Upfront Fee",
+                "Quantity",
+                hourly * discount * upfront * hours,
+            )
+            dimensions[rate_code] = dimension
+        terms["{}.{}".format(sku, code)] = {
+            "offerTermCode": code,
+            "sku": sku,
+            "effectiveDate": "2024-03-01T00:00:00Z",
+            "priceDimensions": dimensions,
+            "termAttributes": {
+                "LeaseContractLength": length,
+                "OfferingClass": "standard",
+                "PurchaseOption": option,
+            },
+        }
+    return terms
+
+
+def write_offer_file(f, service_code, scale=1.0, region_scale=1.0, seed=0):
+    """Write a synthetic Price List offer file of service_code to text stream f.
+
+    Instance SKUs are laid out like the real file: one per instance type, region
+    and the service's variants (engines etc.), with OnDemand and Reserved terms,
+    mixed with SKUs of other product families. Returns the number of products.
+    """
+    product_family, type_format, families, attributes = OFFER_SERVICES[service_code]
+    rnd = random.Random(seed)
+    regions = synthetic_regions(region_scale)
+    products = []
+    for n in range(max(1, int(round(families * scale)))):
+        family = "{}{}{}".format("cmrixtgp"[n % 8], n // 8 % 9 + 1, _tag(n // 72))
+        start = rnd.randint(0, len(SIZES) - SIZES_PER_FAMILY)
+        for size, vcpu, memory in SIZES[start : start + SIZES_PER_FAMILY]:
+            instance_type = type_format.format(family, size)
+            hourly = 0.017 * vcpu * (1 + rnd.random())
+            for region, location in regions.items():
+                if region != "us-east-1" and rnd.random() > AVAILABILITY:
+                    continue
+                # Several SKUs per instance type and region, one per variant
+                variants = rnd.randint(2, 6)
+                for _ in range(variants):
+                    product = {
+                        "location": location,
+                        "locationType": "AWS Region",
+                        "regionCode": region,
+                        "instanceType": instance_type,
+                        "instanceFamily": FAMILY_CATEGORIES[n % 5],
+                        "vcpu": str(vcpu),
+                        "memory": "%g GiB" % memory,
+                        "memoryGib": "%g" % memory,
+                        "networkPerformance": rnd.choice(NETWORK_PERFORMANCE),
+                        "currentGeneration": "Yes",
+                        "operation": "CreateDBInstance:0002",
+                        "usagetype": "InstanceUsage:" + instance_type,
+                        "servicecode": service_code,
+                    }
+                    product.update(attributes(rnd, instance_type))
+                    products.append((_sku(rnd), product_family, product, hourly))
+                for _ in range(int(round(variants * OTHER_SKUS))):
+                    product = {
+                        "location": location,
+                        "locationType": "AWS Region",
+                        "regionCode": region,
+                        "usagetype": "StorageUsage",
+                        "servicecode": service_code,
+                    }
+                    products.append((_sku(rnd), "Storage", product, 0.0001))
+
+    f.write(
+        '{\n  "formatVersion" : "v1.0",\n  "disclaimer" : "Synthetic offer file",\n'
+    )
+    f.write('  "offerCode" : "{}",\n'.format(service_code))
+    f.write('  "version" : "20240301000000",\n')
+    f.write('  "publicationDate" : "2024-03-01T00:00:00Z",\n  "products" : {')
+    for n, (sku, family, product_attributes, _) in enumerate(products):
+        product = {
+            "sku": sku,
+            "productFamily": family,
+            "attributes": product_attributes,
+        }
+        f.write("," if n else "")
+        f.write("\n    {} : {}".format(json.dumps(sku), json.dumps(product, indent=2)))
+    f.write('\n  },\n  "terms" : {\n    "OnDemand" : {')
+    for n, (sku, _, _, hourly) in enumerate(products):
+        f.write("," if n else "")
+        f.write(
+            "\n      {} : {}".format(
+                json.dumps(sku), json.dumps(_ondemand_terms(sku, hourly), indent=2)
+            )
+        )
+    f.write('\n    },\n    "Reserved" : {')
+    n = 0
+    for sku, family, _, hourly in products:
+        if family == product_family:
+            f.write("," if n else "")
+            n += 1
+            f.write(
+                "\n      {} : {}".format(
+                    json.dumps(sku), json.dumps(_reserved_terms(sku, hourly), indent=2)
+                )
+            )
+    f.write("\n    }\n  }\n}\n")
+    return len(products)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("-o", "--output", default="instances.json")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--region-scale", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--offer",
+        choices=sorted(OFFER_SERVICES),
+        help="write an offer file of this service instead of an instances.json",
+    )
+    args = parser.parse_args()
+
+    region_scale = args.scale if args.region_scale is None else args.region_scale
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    if args.offer:
+        with open(args.output, "w") as f:
+            count = write_offer_file(f, args.offer, args.scale, region_scale, args.seed)
+        print("Wrote {} products to {}".format(count, args.output))
+        return
+
+    instances = generate(args.scale, region_scale, args.seed)
+    with open(args.output, "w") as f:
+        json.dump(instances, f, indent=1, sort_keys=True, separators=(",", ": "))
+    print("Wrote {} instances to {}".format(len(instances), args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,19 @@
 #!/usr/bin/env python
-import requests
-import json
 from json import encoder
 import sys
 import botocore
 import botocore.exceptions
-import boto3
 
 import six
 from tqdm import tqdm
 
+import clients
 import ec2
+import json_output
+import offer_versions
+import offers
+import price_join
+import regions
 
 
 def add_pretty_names(instances):
@@ -61,24 +64,43 @@ def add_pretty_names(instances):
         i["pretty_name"] = " ".join([b for b in bits if b])
 
 
-def scrape(output_file, input_file=None):
+def scrape(output_file, input_file=None, incremental=False):
+    # skip the scrape if the offer file did not change since the last build
+    versions = None
+    if incremental and not input_file:
+        versions = offer_versions.OfferVersions(output_file, ["AmazonElastiCache"])
+        if versions.unchanged():
+            return
+
     # if an argument is given, use that as the path for the json file
-    if input_file:
-        with open(input_file) as json_data:
-            data = json.load(json_data)
-    else:
-        price_index = "https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/AmazonElastiCache/current/index.json"
-        index = requests.get(price_index)
-        data = index.json()
-
-    caches_instances = {}
+    reader = offers.OfferReader(
+        input_file or offers.offer_url("AmazonElastiCache"),
+        product_families=["Cache Instance"],
+    )
+
+    reserved_mapping = {
+        "1yr All Upfront": "yrTerm1.allUpfront",
+        "1yr Partial Upfront": "yrTerm1.partialUpfront",
+        "1yr No Upfront": "yrTerm1.noUpfront",
+        "1yr Light Utilization": "yrTerm1.lightUtilization",
+        "1yr Medium Utilization": "yrTerm1.mediumUtilization",
+        "1yr Heavy Utilization": "yrTerm1.heavyUtilization",
+        "3yr All Upfront": "yrTerm3.allUpfront",
+        "3yr Partial Upfront": "yrTerm3.partialUpfront",
+        "3yr No Upfront": "yrTerm3.noUpfront",
+        "3yr Light Utilization": "yrTerm3.lightUtilization",
+        "3yr Medium Utilization": "yrTerm3.mediumUtilization",
+        "3yr Heavy Utilization": "yrTerm3.heavyUtilization",
+    }
+
+    join = price_join.PriceJoin(reserved_mapping)
     instances = {}
 
     # region mapping, someone thought it was handy not to include the region id's :(
-    regions = ec2.get_region_descriptions()
+    registry = regions.get_registry().copy()
 
     # loop through products, and only fetch available instances for now
-    for sku, product in tqdm(six.iteritems(data["products"])):
+    for sku, product in tqdm(reader.products()):
         if product.get("productFamily", None) == "Cache Instance":
             attributes = product["attributes"]
 
@@ -92,12 +114,10 @@ def scrape(output_file, input_file=None):
                 # at one point this region was local but was upgraded to a standard region
                 # however some SKUs still reference the old region
                 region = "ap-northeast-3"
-                regions[location] = region
-            elif location not in regions.values():
-                region = attributes["regionCode"]
-                regions[location] = region
+                registry.add(location, region)
             else:
-                region = regions[location]
+                region = attributes["regionCode"]
+                registry.add(location, region)
 
             # Fix https://github.com/vantage-sh/ec2instances.info/issues/644 - Outpost pricing overwriting reserved
             loctype = attributes["locationType"]
@@ -119,7 +139,13 @@ def scrape(output_file, input_file=None):
             attributes["pricing"] = {}
             attributes["pricing"][region] = {}
 
-            caches_instances[sku] = attributes
+            join.add_sku(
+                sku,
+                instance_type,
+                region,
+                [attributes["cache_engine"]],
+                [attributes["cache_engine"]],
+            )
 
             if instance_type not in instances.keys():
                 # delete some attributes that are inconsistent among skus
@@ -137,104 +163,11 @@ def scrape(output_file, input_file=None):
 
                 instances[instance_type] = new_attributes
 
-    # Parse ondemand pricing
-    for sku, offers in six.iteritems(data["terms"]["OnDemand"]):
-        for code, offer in six.iteritems(offers):
-            for key, dimension in six.iteritems(offer["priceDimensions"]):
-                # skip these for now
-                if any(
-                    descr in dimension["description"].lower()
-                    for descr in [
-                        "transfer",
-                        "global",
-                        "storage",
-                        "iops",
-                        "requests",
-                        "multi-az",
-                    ]
-                ):
-                    continue
-
-                instance = caches_instances.get(sku)
-                if not instance:
-                    # print(f"WARNING: Received on demand pricing info for unknown sku={sku}")
-                    continue
-
-                region = instance["region"]
-                instance_type = instance["instance_type"]
-                cache_engine = instance["cache_engine"]
-
-                if region not in instances[instance_type]["pricing"]:
-                    # Initialise pricing for the instance_type
-                    instances[instance_type]["pricing"][region] = {}
-
-                instances[instance_type]["pricing"][region][cache_engine] = {
-                    "ondemand": float(dimension["pricePerUnit"]["USD"])
-                }
-
-                # build the list of regions where each instance is available
-                # we have to do a reverse lookup from the regions list
-                l = ""
-                for l, r in regions.items():
-                    if instance["region"] == r:
-                        location = l
-                        break
-                instances[instance["instance_type"]]["regions"][instance["region"]] = l
-
-    reserved_mapping = {
-        "1yr All Upfront": "yrTerm1.allUpfront",
-        "1yr Partial Upfront": "yrTerm1.partialUpfront",
-        "1yr No Upfront": "yrTerm1.noUpfront",
-        "1yr Light Utilization": "yrTerm1.lightUtilization",
-        "1yr Medium Utilization": "yrTerm1.mediumUtilization",
-        "1yr Heavy Utilization": "yrTerm1.heavyUtilization",
-        "3yr All Upfront": "yrTerm3.allUpfront",
-        "3yr Partial Upfront": "yrTerm3.partialUpfront",
-        "3yr No Upfront": "yrTerm3.noUpfront",
-        "3yr Light Utilization": "yrTerm3.lightUtilization",
-        "3yr Medium Utilization": "yrTerm3.mediumUtilization",
-        "3yr Heavy Utilization": "yrTerm3.heavyUtilization",
-    }
-
-    # Parse reserved pricing
-    for sku, offers in six.iteritems(data["terms"]["Reserved"]):
-        for code, offer in six.iteritems(offers):
-            for key, dimension in six.iteritems(offer["priceDimensions"]):
-                instance = caches_instances.get(sku)
-                if not instance:
-                    # print(f"WARNING: Received reserved pricing info for unknown sku={sku}")
-                    continue
-
-                region = instance["region"]
-                instance_type = instance["instance_type"]
-                cache_engine = instance["cache_engine"]
-
-                # create a regional hash
-                if region not in instance["pricing"]:
-                    instance["pricing"][region] = {}
-
-                # create a cache_engine hash
-                if cache_engine not in instance["pricing"][region]:
-                    instance["pricing"][region][instance["cache_engine"]] = {}
-
-                # create a reserved hash
-                if (
-                    "reserved"
-                    not in instances[instance_type]["pricing"][region][cache_engine]
-                ):
-                    instances[instance_type]["pricing"][region][cache_engine][
-                        "reserved"
-                    ] = {}
-
-                reserved_type = f"%s %s" % (
-                    offer["termAttributes"]["LeaseContractLength"],
-                    offer["termAttributes"]["PurchaseOption"],
-                )
-
-                instances[instance_type]["pricing"][region][cache_engine]["reserved"][
-                    "%s-%s"
-                    % (reserved_mapping[reserved_type], dimension["unit"].lower())
-                ] = float(dimension["pricePerUnit"]["USD"])
+    for sku, terms in reader.terms("OnDemand"):
+        join.add_ondemand(sku, terms)
+    for sku, terms in reader.terms("Reserved"):
+        join.add_reserved(sku, terms)
+    join.apply(instances, registry)
 
     # Calculate all reserved effective pricings (upfront hourly + hourly price)
     # Since Light, Medium and Heavy utilization are from previous generations and are not available for choosing
@@ -300,8 +233,10 @@ def scrape(output_file, input_file=None):
 
     # write output to file
     encoder.FLOAT_REPR = lambda o: format(o, ".5f")
-    with open(output_file, "w+") as outfile:
-        json.dump(list(instances.values()), outfile, indent=1)
+    json_output.write_instances(output_file, instances.values())
+
+    if versions:
+        versions.record()
 
 
 def add_max_clients(instances):
@@ -343,11 +278,11 @@ def add_cache_parameters(instances):
 
     iparams = {}
 
+    cache_client = clients.get_client("elasticache", region_name="us-east-1")
     for param_fam in [
         "memcached1.6",
         "redis6.x",
     ]:
-        cache_client = boto3.client("elasticache", region_name="us-east-1")
         response = cache_client.describe_engine_default_parameters(
             CacheParameterGroupFamily=param_fam,
         )
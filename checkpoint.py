@@ -0,0 +1,139 @@
+"""
+Checkpoints of the EC2 scrape, so a failed build can be resumed.
+
+The instance list from ec2.get_instances() is checkpointed first. After an
+enrichment stage succeeds, the fields it declares as writes are pickled for
+every instance. That file is keyed by the stage name and a fingerprint of the
+fields the stage reads, taken just before it runs. When resuming, a stage whose
+inputs hash to the same fingerprint gets its saved fields restored and is not
+run again. So a failed build is resumed from the stage that failed, and a stage
+whose inputs changed, including everything downstream of a stage that was
+re-run with different results, runs again.
+
+Checkpoints belong to one build: a build that does not resume starts over with
+none, and a build that completes removes them. Checkpoints older than
+CHECKPOINT_MAX_AGE hours are not resumed from either, as the prices, zones etc.
+they hold are stale by then.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+import uuid
+
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", os.path.join(".cache", "checkpoints"))
+CHECKPOINT_MAX_AGE = float(os.getenv("CHECKPOINT_MAX_AGE", "24"))
+RUN_FILE = "run.json"
+
+
+def fingerprint(instances, fields):
+    """sha256 of the given fields of instances"""
+    digest = hashlib.sha256()
+    for i in instances:
+        values = [getattr(i, field) for field in sorted(fields)]
+        digest.update(json.dumps(values, sort_keys=True, default=repr).encode())
+    return digest.hexdigest()
+
+
+class Checkpoints(object):
+    def __init__(self, directory=CHECKPOINT_DIR, resume=False):
+        self.directory = directory
+        self.resume = resume and self._resumable()
+        if not self.resume:
+            self._start()
+
+    def _resumable(self):
+        try:
+            with open(os.path.join(self.directory, RUN_FILE)) as f:
+                run = json.load(f)
+        except FileNotFoundError:
+            print("No checkpoints to resume from, starting a new build")
+            return False
+        except (OSError, ValueError) as e:
+            print("WARNING: Ignoring unreadable checkpoints: {!r}".format(e))
+            return False
+        age = (time.time() - run["started"]) / 3600
+        if age > CHECKPOINT_MAX_AGE:
+            print(
+                "WARNING: Checkpoints of build {} are {:.0f} hours old, "
+                "starting a new build".format(run["id"], age)
+            )
+            return False
+        print("Resuming build {}".format(run["id"]))
+        return True
+
+    def _start(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+        with open(os.path.join(self.directory, RUN_FILE), "w") as f:
+            json.dump({"id": uuid.uuid4().hex[:12], "started": time.time()}, f)
+
+    def complete(self):
+        """The build succeeded, its checkpoints are not needed anymore"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _path(self, name, key=None):
+        if key is not None:
+            name = "{}-{}".format(name, key)
+        return os.path.join(self.directory, name + ".pickle")
+
+    def _load(self, path):
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            print("WARNING: Ignoring unreadable checkpoint {}: {!r}".format(path, e))
+            return None
+
+    def _dump(self, path, data):
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    def _save(self, stage, path, instances):
+        fields = {
+            i.instance_type: {field: getattr(i, field) for field in stage.writes}
+            for i in instances
+        }
+        self._dump(path, fields)
+
+        # Checkpoints of the stage with other inputs can not be used anymore
+        prefix = stage.name + "-"
+        for name in os.listdir(self.directory):
+            other = os.path.join(self.directory, name)
+            if name.startswith(prefix) and other != path:
+                os.unlink(other)
+
+    def call(self, name, func):
+        """func(), or its result checkpointed under name when resuming"""
+        path = self._path(name)
+        if self.resume:
+            result = self._load(path)
+            if result is not None:
+                print("{} (restored from checkpoint)".format(name))
+                return result
+        result = func()
+        self._dump(path, result)
+        return result
+
+    def run(self, stage, instances):
+        """Run stage on instances, or restore it from its checkpoint"""
+        key = fingerprint(instances, stage.reads)[:16]
+        path = self._path(stage.name, key)
+
+        if self.resume:
+            saved = self._load(path)
+            if saved is not None:
+                print("{} (restored from checkpoint)".format(stage.banner))
+                for i in instances:
+                    for field, value in saved.get(i.instance_type, {}).items():
+                        setattr(i, field, value)
+                return
+
+        stage.run(instances)
+        self._save(stage, path, instances)
@@ -0,0 +1,61 @@
+"""
+Process-wide registry of boto3 clients, keyed by (service, region).
+
+Clients are created lazily from one shared session with a larger connection
+pool and adaptive retries, and are reused for the rest of the build. boto3
+sessions are not thread safe but the clients they create are, so creation is
+serialized with a lock and the clients can then be shared by concurrent stages.
+"""
+
+import threading
+
+import boto3
+from botocore.config import Config
+
+import instrument
+import replay
+
+MAX_POOL_CONNECTIONS = 50
+
+# Error codes returned by AWS APIs when we are calling them too fast
+THROTTLING_ERRORS = ("Throttling", "ThrottlingException", "RequestLimitExceeded")
+
+CONFIG = Config(
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    retries={"mode": "adaptive", "max_attempts": 10},
+)
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+
+
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.session.Session()
+        return _session
+
+
+def get_client(service, region_name="us-east-1", retries=None):
+    """Return the shared client for a service and region.
+
+    retries overrides the default retry configuration, clients with different
+    retry settings are cached separately.
+    """
+    key = (service, region_name, tuple(sorted((retries or {}).items())))
+    client = _clients.get(key)
+    if client is None:
+        session = get_session()
+        config = CONFIG
+        if retries is not None:
+            config = CONFIG.merge(Config(retries=retries))
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = session.client(service, region_name=region_name, config=config)
+                instrument.watch_client(client)
+                replay.watch_client(client)
+                _clients[key] = client
+    return client
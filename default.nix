@@ -36,6 +36,7 @@ let
       (python39.withPackages (p: with p; lib.flatten [
         boto
         boto3
+        ijson
         (invocations.overridePythonAttrs (old: { propagatedBuildInputs = old.propagatedBuildInputs ++ [ tqdm ]; }))
         invoke
         lxml
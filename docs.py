@@ -0,0 +1,109 @@
+"""
+AWS documentation pages, fetched and parsed once per build.
+
+Several scrapers read the same pages (ebs-optimized.html is used for both EC2
+and RDS), so get() keeps every parsed page for the life of the process and
+each Document memoizes the tables it has been asked for. Documents are
+shared between scrapers and stages running concurrently: parsers must not
+modify the trees they are given.
+"""
+
+import copy
+import re
+import threading
+
+from lxml import etree
+
+import http_cache
+
+# The tables of the docs.aws.amazon.com user guides
+TABLES = '//div[@class="table-contents"]//table'
+# Rows with data cells, header rows only have <th>
+DATA_ROWS = ".//tr[./td]"
+
+
+def sanitize_instance_type(instance_type):
+    """Typos and other bad data are common in the instance type columns for some reason"""
+    # Remove random whitespace
+    instance_type = re.sub(r"\s+", "", instance_type, flags=re.UNICODE)
+
+    # Correct typos
+    typo_corrections = {
+        "x1.16large": "x1.16xlarge",  # https://github.com/powdahound/ec2instances.info/issues/199
+        "i3.4xlxarge": "i3.4xlarge",  # https://github.com/powdahound/ec2instances.info/issues/227
+        "i3.16large": "i3.16xlarge",  # https://github.com/powdahound/ec2instances.info/issues/227
+        "p4d.2xlarge": "p4d.24xlarge",  # as of 2020-11-15
+    }
+    return typo_corrections.get(instance_type, instance_type)
+
+
+def totext(elt):
+    s = etree.tostring(elt, method="text", encoding="unicode").strip()
+    return re.sub(r"\*\d$", "", s)
+
+
+class Document(object):
+    def __init__(self, url, tree):
+        self.url = url
+        self.tree = tree
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def tables(self, xpath=TABLES):
+        """All tables matching xpath, looked up once"""
+        with self._lock:
+            tables = self._tables.get(xpath)
+            if tables is None:
+                tables = self._tables[xpath] = self.tree.xpath(xpath)
+        return tables
+
+    def table(self, index, xpath=TABLES):
+        return self.tables(xpath)[index]
+
+    def rows(self, index, xpath=TABLES, rows=DATA_ROWS):
+        """The <tr> elements of a table"""
+        return self.table(index, xpath).xpath(rows)
+
+    def text_rows(
+        self,
+        index,
+        xpath=TABLES,
+        rows=DATA_ROWS,
+        instance_type_column=None,
+        strip_tags=(),
+    ):
+        """Yield each row of a table as a list of cell texts.
+
+        Cells are cleaned up with totext(), and the cell in
+        instance_type_column, if given, with sanitize_instance_type() too.
+        Elements named in strip_tags (e.g. "sup" footnote markers) are
+        left out of the text along with their tail, as etree.strip_elements()
+        would, without modifying the shared tree.
+        """
+        for row in self.rows(index, xpath, rows):
+            if strip_tags:
+                row = copy.deepcopy(row)
+                etree.strip_elements(row, *strip_tags)
+            cells = [totext(cell) for cell in row.xpath("td")]
+            if instance_type_column is not None:
+                cells[instance_type_column] = sanitize_instance_type(
+                    cells[instance_type_column]
+                )
+            yield cells
+
+
+_documents = {}
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def get(url):
+    """The parsed page at url, fetched through http_cache once per process"""
+    with _locks_lock:
+        lock = _locks.setdefault(url, threading.Lock())
+    with lock:
+        document = _documents.get(url)
+        if document is None:
+            tree = etree.parse(http_cache.urlopen(url), etree.HTMLParser())
+            document = _documents[url] = Document(url, tree)
+    return document
@@ -0,0 +1,228 @@
+"""
+Resumable downloads of large files such as the Price List offer files.
+
+The body is spooled to DOWNLOAD_DIR in chunks exactly as it came over the wire,
+gzip compressed when the server supports it, next to a small JSON file with the
+validators it was served with. An interrupted download is resumed with a Range
+request guarded by If-Range, so it either continues where it stopped or starts
+over if the file changed in the meantime. A finished download is checked
+against the announced size and, when available, a sha256 from the caller or an
+MD5 ETag, and is reused on the next build if a conditional GET says it is
+still current.
+"""
+
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+
+import requests
+import urllib3.exceptions
+
+import http_cache
+import instrument
+
+DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR", os.path.join(".cache", "downloads"))
+DOWNLOAD_ATTEMPTS = int(os.getenv("DOWNLOAD_ATTEMPTS", "5"))
+CHUNK_SIZE = 1024 * 1024
+REQUEST_TIMEOUT = 60
+
+TRANSIENT_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+    urllib3.exceptions.HTTPError,
+)
+
+
+class DownloadError(Exception):
+    pass
+
+
+def _is_transient(error):
+    """Network errors and 5xx responses are worth retrying, 4xx are not"""
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def _default_path(url):
+    return os.path.join(DOWNLOAD_DIR, hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+
+def _meta_path(path):
+    return path + ".json"
+
+
+def _load_meta(meta_path):
+    try:
+        with open(meta_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_meta(meta_path, meta):
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+
+
+def _file_digests(path):
+    sha256, md5 = hashlib.sha256(), hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+            md5.update(chunk)
+    return sha256, md5
+
+
+def _total_size(response, offset):
+    """Full size of the encoded body, or None when the server does not say"""
+    content_range = response.headers.get("Content-Range")
+    if content_range:
+        match = re.match(r"bytes \d+-\d+/(\d+)", content_range)
+        if match:
+            return int(match.group(1))
+    length = response.headers.get("Content-Length")
+    if length is not None:
+        return offset + int(length)
+    return None
+
+
+def _md5_etag(etag):
+    # S3 ETags of single part uploads are the MD5 of the stored bytes
+    if etag and re.match(r'^"[0-9a-f]{32}"$', etag):
+        return etag.strip('"')
+    return None
+
+
+def _fetch(url, part_path, meta):
+    """One attempt at getting the rest of url into part_path, updating meta"""
+    headers = {"Accept-Encoding": "gzip"}
+    offset = 0
+    if os.path.exists(part_path) and meta.get("etag"):
+        offset = os.path.getsize(part_path)
+        headers["Range"] = "bytes={}-".format(offset)
+        headers["If-Range"] = meta["etag"]
+
+    session = http_cache.get_session()
+    with session.get(
+        url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT
+    ) as response:
+        if response.status_code == 416:
+            # Nothing left to fetch, or a stale part; either way start over
+            os.unlink(part_path)
+            return False
+        response.raise_for_status()
+        encoding = response.headers.get("Content-Encoding", "identity")
+        if response.status_code != 206:
+            offset = 0
+        elif encoding != meta.get("encoding"):
+            # The rest would not be the same byte stream as what we have
+            os.unlink(part_path)
+            return False
+        meta.update(
+            {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "encoding": encoding,
+                "size": _total_size(response, offset),
+            }
+        )
+        with open(part_path, "r+b" if offset else "wb") as f:
+            f.seek(offset)
+            f.truncate()
+            for chunk in response.raw.stream(CHUNK_SIZE, decode_content=False):
+                f.write(chunk)
+    return True
+
+
+def _verify(part_path, meta, expected_sha256):
+    size = os.path.getsize(part_path)
+    if meta.get("size") is not None and size != meta["size"]:
+        raise DownloadError(
+            "{}: got {} bytes, expected {}".format(meta["url"], size, meta["size"])
+        )
+    sha256, md5 = _file_digests(part_path)
+    if expected_sha256 and sha256.hexdigest() != expected_sha256:
+        raise DownloadError("{}: sha256 mismatch".format(meta["url"]))
+    etag_md5 = _md5_etag(meta.get("etag"))
+    if etag_md5 and meta["encoding"] == "identity" and md5.hexdigest() != etag_md5:
+        raise DownloadError("{}: MD5 does not match the ETag".format(meta["url"]))
+    meta["sha256"] = sha256.hexdigest()
+
+
+def _is_current(url, meta):
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    if not headers:
+        return False
+    response = http_cache.get_session().head(
+        url, headers=headers, timeout=REQUEST_TIMEOUT
+    )
+    return response.status_code == 304
+
+
+def download(url, path=None, expected_sha256=None, attempts=None):
+    """Download url to path (by default under DOWNLOAD_DIR) and return path.
+
+    Transient network errors and 5xx responses are retried up to `attempts`
+    times, each retry resuming from what is already on disk. The file is stored with the
+    Content-Encoding it was served with; read it with open_download().
+    """
+    attempts = DOWNLOAD_ATTEMPTS if attempts is None else attempts
+    path = path or _default_path(url)
+    part_path, meta_path = path + ".part", _meta_path(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    meta = _load_meta(meta_path) or {}
+    if meta.get("complete") and os.path.exists(path):
+        if expected_sha256 in (None, meta.get("sha256")) and _is_current(url, meta):
+            return path
+        meta = {}
+
+    meta["complete"] = False
+    for attempt in range(attempts):
+        try:
+            if _fetch(url, part_path, meta):
+                _verify(part_path, meta, expected_sha256)
+                break
+        except (DownloadError, requests.exceptions.HTTPError) + TRANSIENT_ERRORS as e:
+            if not isinstance(e, DownloadError) and not _is_transient(e):
+                raise
+            if isinstance(e, DownloadError):
+                # A corrupt part can not be resumed
+                os.unlink(part_path)
+            if attempt == attempts - 1:
+                raise
+            print("WARNING: Download of {} interrupted ({!r}), retrying".format(url, e))
+            instrument.count("http_retries")
+            time.sleep(2**attempt)
+        finally:
+            _save_meta(meta_path, meta)
+    else:
+        raise DownloadError("{}: giving up after {} attempts".format(url, attempts))
+
+    os.replace(part_path, path)
+    meta["complete"] = True
+    _save_meta(meta_path, meta)
+    return path
+
+
+@contextlib.contextmanager
+def open_download(path):
+    """Open a file written by download() as a decoded binary stream"""
+    meta = _load_meta(_meta_path(path)) or {}
+    if meta.get("encoding") == "gzip":
+        with gzip.open(path, "rb") as f:
+            yield f
+    else:
+        with open(path, "rb") as f:
+            yield f
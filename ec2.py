@@ -1,21 +1,24 @@
 import botocore
 import botocore.exceptions
-import boto3
+import clients
+import collections
+from concurrent import futures
 from datetime import datetime
 import locale
 import json
-from pkg_resources import resource_filename
-import re
+import offers
+import os
+import pricing_pager
+import regions
+import replay
 import scrape
+import spot_stats
 import traceback
 
 
 def canonicalize_location(location, from_pricing_api=True):
     """Ensure location aligns with one of the options returned by get_region_descriptions()"""
-    # The pricing API returns locations with the old EU prefix
-    if not from_pricing_api:
-        return re.sub("^Europe", "EU", location)
-    return re.sub("^EU", "Europe", location)
+    return regions.canonicalize_location(location, from_pricing_api)
 
 
 # Translate between the API and what is used locally
@@ -68,23 +71,14 @@ def translate_reserved_terms(term_attributes):
 
 # The pricing API requires human readable names for some reason
 def get_region_descriptions():
-    result = {}
-    # Source: https://github.com/boto/botocore/blob/develop/botocore/data/endpoints.json
-    endpoint_file = resource_filename("botocore", "data/endpoints.json")
-    with open(endpoint_file, "r") as f:
-        endpoints = json.load(f)
-        for partition in endpoints["partitions"]:
-            for region in partition["regions"]:
-                # Skip secret and Chinese regions
-                if "us-iso" not in region and not region.startswith("cn-"):
-                    result[partition["regions"][region]["description"]] = region
-    return result
+    """Map region location names to codes; a copy the caller may change"""
+    return dict(regions.get_registry().descriptions)
 
 
 def get_instances():
     instance_types = {}
     try:
-        ec2_client = boto3.client("ec2", region_name="us-east-1")
+        ec2_client = clients.get_client("ec2", region_name="us-east-1")
         ec2_pager = ec2_client.get_paginator("describe_instance_types")
         instance_type_iterator = ec2_pager.paginate()
         for result in instance_type_iterator:
@@ -97,8 +91,7 @@ def get_instances():
         raise e
 
     instances = {}
-    pricing_client = boto3.client("pricing", region_name="us-east-1")
-    product_pager = pricing_client.get_paginator("get_products")
+    product_pager = pricing_pager.ProductPager()
 
     product_iterator = product_pager.paginate(
         ServiceCode="AmazonEC2",
@@ -142,44 +135,55 @@ def get_instances():
             if new_inst is not None:
                 instances[instance_type] = new_inst
 
+    print(f"Pricing API (instance types): {product_pager}")
     print(f"Found data for instance types: {', '.join(sorted(instances.keys()))}")
     return list(instances.values())
 
 
-def add_pricing(imap):
-    descriptions = get_region_descriptions()
-    pricing_client = boto3.client("pricing", region_name="us-east-1")
-    product_pager = pricing_client.get_paginator("get_products")
+# Where add_pricing() gets EC2 prices from: "api" for the Pricing API, "bulk"
+# for the per-region bulk offer files, or the path or URL of an offer file
+PRICING_SOURCE = os.getenv("PRICING_SOURCE", "api")
 
-    product_iterator = product_pager.paginate(
-        ServiceCode="AmazonEC2",
-        Filters=[
-            {"Type": "TERM_MATCH", "Field": "capacityStatus", "Value": "Used"},
-            {"Type": "TERM_MATCH", "Field": "tenancy", "Value": "Shared"},
-            {
-                "Type": "TERM_MATCH",
-                "Field": "licenseModel",
-                "Value": "No License required",
-            },
-        ],
-    )
+# Split the add_pricing() query into one concurrent query per value of this
+# product attribute (e.g. "regionCode" or "operatingSystem"). Unset means a
+# single query. Products that lack the attribute are not returned when sharding.
+PRICING_SHARD_BY = os.getenv("PRICING_SHARD_BY") or None
+
+PRICING_FILTERS = [
+    {"Type": "TERM_MATCH", "Field": "capacityStatus", "Value": "Used"},
+    {"Type": "TERM_MATCH", "Field": "tenancy", "Value": "Shared"},
+    {
+        "Type": "TERM_MATCH",
+        "Field": "licenseModel",
+        "Value": "No License required",
+    },
+]
+
+
+def get_attribute_values(attribute_name, service_code="AmazonEC2"):
+    pricing_client = clients.get_client("pricing", region_name="us-east-1")
+    pager = pricing_client.get_paginator("get_attribute_values")
+    values = set()
+    for page in pager.paginate(ServiceCode=service_code, AttributeName=attribute_name):
+        for value in page["AttributeValues"]:
+            values.add(value["Value"])
+    return sorted(values)
+
+
+def get_pricing_offers(filters, label="prices"):
+    """Run one get_products query and reduce each offer to what add_pricing needs.
+
+    Yields (instance_type, location, region_code, platform, ondemand, reserved)
+    tuples in the order the API returns them, as the pages come in.
+    """
+    product_pager = pricing_pager.ProductPager()
+    product_iterator = product_pager.paginate(ServiceCode="AmazonEC2", Filters=filters)
     for product_item in product_iterator:
         for offer_string in product_item.get("PriceList"):
             offer = json.loads(offer_string)
             product = offer.get("product")
             product_attributes = product.get("attributes")
             instance_type = product_attributes.get("instanceType")
-            location = canonicalize_location(product_attributes.get("location"))
-
-            # Add regions local zones and wavelength zones on the fly as we find them
-            if location not in descriptions:
-                descriptions[location] = product_attributes.get("regionCode")
-
-            region = descriptions[location]
-
-            # Skip Chinese regions because they generate incorrect pricing data
-            if region.startswith("cn-"):
-                continue
 
             # Skip capacity block pricing which affects certain p series instances
             if product_attributes["marketoption"] == "CapacityBlock":
@@ -191,28 +195,174 @@ def add_pricing(imap):
             preinstalled_software = product_attributes.get("preInstalledSw")
             platform = translate_platform_name(operating_system, preinstalled_software)
 
-            if instance_type not in imap:
-                print(
-                    f"WARNING: Ignoring pricing - unknown instance type. instance={instance_type}, location={location}"
-                )
-                continue
-
-            # If the instance type is not in us-east-1 imap[instance_type] could fail
             try:
-                inst = imap[instance_type]
-                inst.pricing.setdefault(region, {})
-                inst.regions[region] = location
-                inst.pricing[region].setdefault(platform, {})
-                inst.pricing[region][platform]["ondemand"] = get_ondemand_pricing(terms)
+                ondemand = get_ondemand_pricing(terms)
                 # Some instances don't offer reserved terms at all
                 reserved = get_reserved_pricing(terms)
-                if reserved:
-                    inst.pricing[region][platform]["reserved"] = reserved
             except Exception as e:
                 # print more details about the instance for debugging
                 print(f"ERROR: Exception adding pricing for {instance_type}: {e}")
                 print(traceback.print_exc())
-    add_spot_pricing(imap)
+                continue
+
+            yield (
+                instance_type,
+                product_attributes.get("location"),
+                product_attributes.get("regionCode"),
+                platform,
+                ondemand,
+                reserved,
+            )
+    print(f"Pricing API ({label}): {product_pager}")
+
+
+def _list_pricing_offers(filters, label):
+    return list(get_pricing_offers(filters, label))
+
+
+def add_pricing_offers(imap, descriptions, offers):
+    """Add the offers from get_pricing_offers() to the instances in imap"""
+    for (
+        instance_type,
+        location,
+        region_code,
+        platform,
+        ondemand,
+        reserved,
+    ) in offers:
+        location = canonicalize_location(location)
+
+        # Add regions local zones and wavelength zones on the fly as we find them
+        if location not in descriptions:
+            descriptions[location] = region_code
+
+        region = descriptions[location]
+
+        # Skip Chinese regions because they generate incorrect pricing data
+        if region.startswith("cn-"):
+            continue
+
+        if instance_type not in imap:
+            print(
+                f"WARNING: Ignoring pricing - unknown instance type. instance={instance_type}, location={location}"
+            )
+            continue
+
+        inst = imap[instance_type]
+        inst.pricing.setdefault(region, {})
+        inst.regions[region] = location
+        inst.pricing[region].setdefault(platform, {})
+        inst.pricing[region][platform]["ondemand"] = ondemand
+        if reserved:
+            inst.pricing[region][platform]["reserved"] = reserved
+
+
+def add_pricing(imap, shard_by=None, workers=8, source=None):
+    source = source or PRICING_SOURCE
+    if source != "api":
+        add_bulk_pricing(imap, None if source == "bulk" else source)
+        add_spot_pricing(imap, workers)
+        return
+
+    descriptions = get_region_descriptions()
+
+    shard_by = shard_by or PRICING_SHARD_BY
+    if not shard_by:
+        add_pricing_offers(imap, descriptions, get_pricing_offers(PRICING_FILTERS))
+        add_spot_pricing(imap, workers)
+        return
+
+    shards = get_attribute_values(shard_by)
+    print(f"Querying prices in {len(shards)} shards by {shard_by}")
+    with futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        jobs = collections.deque(
+            pool.submit(
+                _list_pricing_offers,
+                PRICING_FILTERS
+                + [{"Type": "TERM_MATCH", "Field": shard_by, "Value": value}],
+                f"{shard_by}={value}",
+            )
+            for value in shards
+        )
+        # Merge each shard as soon as it and the ones before it are done, in the
+        # sorted shard order so the result doesn't depend on timing
+        while jobs:
+            add_pricing_offers(imap, descriptions, jobs.popleft().result())
+    add_spot_pricing(imap, workers)
+
+
+def is_priced_product(product):
+    """Bulk offer file equivalent of the PRICING_FILTERS used with the API"""
+    attributes = product.get("attributes", {})
+    return (
+        attributes.get("capacitystatus", attributes.get("capacityStatus")) == "Used"
+        and attributes.get("tenancy") == "Shared"
+        and attributes.get("licenseModel") == "No License required"
+        and attributes.get("marketoption") != "CapacityBlock"
+        and "instanceType" in attributes
+    )
+
+
+def add_bulk_pricing(imap, source=None):
+    """Add on demand and reserved prices from EC2 bulk offer files.
+
+    source is the path or URL of a single offer file. By default every
+    per-region offer file is streamed in turn, which keeps peak memory to
+    roughly the products of one region instead of the multi-GB global file.
+    Produces the same Instance.pricing structure as the Pricing API path.
+    """
+    descriptions = get_region_descriptions()
+    sources = [source] if source else offers.region_offer_urls("AmazonEC2")
+
+    for source in sources:
+        print(f"Parsing EC2 offer file {source}...")
+        # sku -> (instance, region, platform) for the products we keep
+        skus = {}
+        with offers.open_offer_file(source) as f:
+            for kind, sku, value in offers.iter_offer_file(f, is_priced_product):
+                if kind == "product":
+                    product_attributes = value["attributes"]
+                    instance_type = product_attributes["instanceType"]
+                    location = canonicalize_location(product_attributes["location"])
+
+                    # Add regions local zones and wavelength zones on the fly as we find them
+                    if location not in descriptions:
+                        descriptions[location] = product_attributes.get("regionCode")
+
+                    region = descriptions[location]
+
+                    # Skip Chinese regions because they generate incorrect pricing data
+                    if region.startswith("cn-"):
+                        continue
+
+                    if instance_type not in imap:
+                        print(
+                            f"WARNING: Ignoring pricing - unknown instance type. instance={instance_type}, location={location}"
+                        )
+                        continue
+
+                    platform = translate_platform_name(
+                        product_attributes.get("operatingSystem"),
+                        product_attributes.get("preInstalledSw"),
+                    )
+                    inst = imap[instance_type]
+                    inst.pricing.setdefault(region, {})
+                    inst.regions[region] = location
+                    inst.pricing[region].setdefault(platform, {})
+                    inst.pricing[region][platform].setdefault("ondemand", 0.0)
+                    skus[sku] = inst.pricing[region][platform]
+                elif sku in skus:
+                    try:
+                        if kind == "OnDemand":
+                            skus[sku]["ondemand"] = get_ondemand_pricing({kind: value})
+                        else:
+                            # Some instances don't offer reserved terms at all
+                            reserved = get_reserved_pricing({kind: value})
+                            if reserved:
+                                skus[sku]["reserved"] = reserved
+                    except Exception as e:
+                        print(f"ERROR: Exception adding pricing for sku {sku}: {e}")
+                        print(traceback.print_exc())
 
 
 def format_price(price):
@@ -261,62 +411,76 @@ def get_reserved_pricing(terms):
     return pricing
 
 
-def add_spot_pricing(imap):
+def get_spot_prices(region, instance_types):
+    """Return the current SpotPriceHistory entries of a single region
+
+    Throttling is retried by the client (see clients.CONFIG).
+    """
+    ec2_client = clients.get_client("ec2", region_name=region)
+    prices_pager = ec2_client.get_paginator("describe_spot_price_history")
+    prices_iterator = prices_pager.paginate(
+        InstanceTypes=instance_types, StartTime=datetime.now()
+    )
+    prices = []
+    for p in prices_iterator:
+        prices.extend(p["SpotPriceHistory"])
+    return prices
+
+
+def add_spot_pricing(imap, workers=8):
     instance_types = list(imap.keys())
+    regions = list(get_region_descriptions().values())
+
+    # get all spot price data, one region per worker
+    with futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        jobs = {
+            region: pool.submit(get_spot_prices, region, instance_types)
+            for region in regions
+        }
 
-    for region in get_region_descriptions().values():
+    # summarize spot prices per instance, region and platform, in a stable
+    # region order
+    aggregators = {}
+    for region in regions:
         try:
-            # get all spot price data from a region
-            ec2_client = boto3.client("ec2", region_name=region)
-            prices_pager = ec2_client.get_paginator("describe_spot_price_history")
-            prices_iterator = prices_pager.paginate(
-                InstanceTypes=instance_types, StartTime=datetime.now()
-            )
-            # populate spot prices into the instance data
-            for p in prices_iterator:
-                prices = p["SpotPriceHistory"]
-                for price in prices:
-                    inst = imap[price["InstanceType"]]
-                    platform = translate_platform_name(
-                        price["ProductDescription"], "NA"
+            prices = jobs[region].result()
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in clients.THROTTLING_ERRORS:
+                print(
+                    'WARNING: Spot region "{}" throttled. Falling back to spot advisor.'.format(
+                        region
                     )
-                    region = price["AvailabilityZone"][0:-1]
-                    if region in inst.pricing:
-                        inst.pricing[region].setdefault(platform, {})
-                        inst.pricing[region][platform].setdefault("spot", [])
-                        inst.pricing[region][platform].setdefault("spot_min", "N/A")
-                        inst.pricing[region][platform].setdefault("spot_max", "N/A")
-                        inst.pricing[region][platform]["spot"].append(
-                            price["SpotPrice"]
-                        )
-                        inst.pricing[region][platform]["spot"].sort(key=float)
-                        inst.pricing[region][platform]["spot_min"] = inst.pricing[
-                            region
-                        ][platform]["spot"][0]
-                        inst.pricing[region][platform]["spot_max"] = inst.pricing[
-                            region
-                        ][platform]["spot"][-1]
-                    else:
-                        # In rare cases (occuring for the first time in July 2022), instances
-                        # can be available in a region as spots but not on demand or any other
-                        # way. In that case, the logic above will fail and we need to wrap it
-                        # in a conditional and create the region first to put spot prices in
-                        # If more edge cases: print(json.dumps(inst.to_dict(), indent=4))
-                        inst.pricing[region] = {
-                            platform: {
-                                "spot": [price["SpotPrice"]],
-                                "spot_min": price["SpotPrice"],
-                                "spot_max": price["SpotPrice"],
-                            }
-                        }
-
-        except botocore.exceptions.ClientError:
+                )
+            else:
+                print(
+                    'WARNING: Spot region "{}" not enabled. Falling back to spot advisor.'.format(
+                        region
+                    )
+                )
+            continue
+        except (botocore.exceptions.BotoCoreError, replay.ReplayMiss) as e:
             print(
-                'WARNING: Spot region "{}" not enabled. Falling back to spot advisor.'.format(
-                    region
+                'WARNING: Spot region "{}" failed ({}). Falling back to spot advisor.'.format(
+                    region, e
                 )
             )
-            pass
+            continue
+
+        for price in prices:
+            platform = translate_platform_name(price["ProductDescription"], "NA")
+            az_region = price["AvailabilityZone"][0:-1]
+            key = (price["InstanceType"], az_region, platform)
+            stats = aggregators.get(key)
+            if stats is None:
+                stats = aggregators[key] = spot_stats.SpotAggregator()
+            stats.add(price["SpotPrice"])
+
+    for (instance_type, az_region, platform), stats in aggregators.items():
+        # In rare cases (occuring for the first time in July 2022), instances
+        # can be available in a region as spots but not on demand or any other
+        # way. In that case the region has to be created first to put spot prices in
+        pricing = imap[instance_type].pricing.setdefault(az_region, {})
+        pricing.setdefault(platform, {}).update(stats.summary())
 
 
 def parse_instance(instance_type, product_attributes, api_description):
@@ -414,7 +578,7 @@ def parse_instance(instance_type, product_attributes, api_description):
 
 
 def describe_regions():
-    ec2_client = boto3.client("ec2", region_name="us-east-1")
+    ec2_client = clients.get_client("ec2", region_name="us-east-1")
     response = ec2_client.describe_regions(AllRegions=True)
     for region in response["Regions"]:
         yield region["RegionName"]
@@ -425,7 +589,7 @@ def describe_instance_type_offerings(region_name="us-east-1", location_type="reg
     location_type = 'region' | 'availability-zone' | 'availability-zone-id'
     """
     try:
-        ec2_client = boto3.client("ec2", region_name=region_name)
+        ec2_client = clients.get_client("ec2", region_name=region_name)
         paginator = ec2_client.get_paginator("describe_instance_type_offerings")
         page_iterator = paginator.paginate(LocationType=location_type)
         filtered_iterator = page_iterator.search("InstanceTypeOfferings")
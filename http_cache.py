@@ -0,0 +1,251 @@
+"""
+On-disk HTTP cache shared by every scraper fetch.
+
+Bodies are stored content-addressed (by sha256) under HTTP_CACHE_DIR/bodies and
+each URL gets a small JSON metadata file under HTTP_CACHE_DIR/urls recording the
+ETag / Last-Modified validators it was served with. Entries younger than
+HTTP_CACHE_TTL seconds are served straight from disk, older ones are revalidated
+with If-None-Match / If-Modified-Since so unchanged documents only cost a 304.
+
+Set HTTP_CACHE_DIR to an empty string to disable caching altogether.
+"""
+
+import atexit
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent import futures
+
+import requests
+import requests.adapters
+
+import instrument
+import replay
+
+CACHE_DIR = os.getenv("HTTP_CACHE_DIR", ".cache/http")
+# Seconds an entry is trusted without asking the server again. The default of 0
+# revalidates on every fetch, which is cheap thanks to conditional GETs.
+CACHE_TTL = int(os.getenv("HTTP_CACHE_TTL", "0"))
+# Entries not used for this many seconds are dropped on eviction
+CACHE_EXPIRE = int(os.getenv("HTTP_CACHE_EXPIRE", str(7 * 24 * 3600)))
+CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(2 * 1024**3)))
+# Evict after this many bytes of new bodies were stored, and once more after
+# get_many() and at exit, rather than walking the whole cache on every miss
+EVICT_EVERY_BYTES = int(os.getenv("HTTP_CACHE_EVICT_EVERY", str(256 * 1024**2)))
+
+REQUEST_TIMEOUT = 60
+# Keep-alive connections kept open per host, shared by all threads
+POOL_SIZE = 32
+
+_session = requests.Session()
+_adapter = replay.http_adapter(pool_connections=16, pool_maxsize=POOL_SIZE)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+_session.hooks["response"].append(instrument.count_http_response)
+_evict_lock = threading.Lock()
+_stored_lock = threading.Lock()
+# Bytes of bodies stored since the last eviction
+_stored_bytes = 0
+
+
+def get_session():
+    """The pooled requests session used for every fetch"""
+    return _session
+
+
+def _url_key(url):
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def _meta_path(url):
+    return os.path.join(CACHE_DIR, "urls", _url_key(url) + ".json")
+
+
+def _body_path(digest):
+    return os.path.join(CACHE_DIR, "bodies", digest[:2], digest)
+
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _load_entry(url):
+    """Return (meta, body) for a cached URL, or (None, None) on a miss"""
+    try:
+        with open(_meta_path(url), "r") as f:
+            meta = json.load(f)
+        with open(_body_path(meta["sha256"]), "rb") as f:
+            body = f.read()
+    except (OSError, ValueError, KeyError):
+        return None, None
+    return meta, body
+
+
+def _store_entry(url, meta, body=None):
+    if body is not None:
+        path = _body_path(meta["sha256"])
+        if not os.path.exists(path):
+            _atomic_write(path, body)
+    _atomic_write(_meta_path(url), json.dumps(meta).encode("utf-8"))
+
+
+def _touch(meta):
+    # The body mtime doubles as the last-used time for LRU eviction
+    try:
+        os.utime(_body_path(meta["sha256"]))
+    except OSError:
+        pass
+
+
+def get(url):
+    """Fetch url and return the response body as bytes, using the cache"""
+    if not CACHE_DIR:
+        response = _session.get(url, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.content
+
+    now = time.time()
+    meta, body = _load_entry(url)
+    headers = {}
+    if meta is not None:
+        if now - meta["checked_at"] < CACHE_TTL:
+            _touch(meta)
+            return body
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    response = _session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304 and meta is not None:
+        meta["checked_at"] = now
+        _store_entry(url, meta)
+        _touch(meta)
+        return body
+    response.raise_for_status()
+
+    body = response.content
+    meta = {
+        "url": url,
+        "sha256": hashlib.sha256(body).hexdigest(),
+        "size": len(body),
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "checked_at": now,
+    }
+    _store_entry(url, meta, body)
+    _stored(len(body))
+    return body
+
+
+def urlopen(url):
+    """Drop-in for urllib2.urlopen(url) when the caller only needs to read()"""
+    return io.BytesIO(get(url))
+
+
+def _stored(size):
+    global _stored_bytes
+    with _stored_lock:
+        _stored_bytes += size
+        due = _stored_bytes >= EVICT_EVERY_BYTES
+    if due:
+        evict_pending()
+
+
+def evict_pending():
+    """evict() if bodies were stored since the last eviction"""
+    global _stored_bytes
+    with _stored_lock:
+        if not _stored_bytes:
+            return
+        _stored_bytes = 0
+    evict()
+
+
+atexit.register(evict_pending)
+
+
+def evict(max_bytes=None, expire=None):
+    """Drop expired bodies, then least recently used ones until under max_bytes.
+
+    URL entries pointing at an evicted body are treated as misses by
+    _load_entry, so only the bodies need to be removed here.
+    """
+    if not CACHE_DIR:
+        return
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    expire = CACHE_EXPIRE if expire is None else expire
+
+    with _evict_lock:
+        bodies = []
+        for root, dirs, files in os.walk(os.path.join(CACHE_DIR, "bodies")):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                bodies.append((st.st_mtime, st.st_size, path))
+
+        now = time.time()
+        total = sum(size for _, size, _ in bodies)
+        for mtime, size, path in sorted(bodies):
+            if total <= max_bytes and now - mtime < expire:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+
+
+class FetchResult(object):
+    """Outcome of fetching one URL with get_many()"""
+
+    def __init__(self, url, body=None, error=None, elapsed=0.0):
+        self.url = url
+        self.body = body
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        status = "ok" if self.ok else "error={!r}".format(self.error)
+        return "<FetchResult {} {} {:.3f}s>".format(self.url, status, self.elapsed)
+
+
+def _timed_get(url):
+    start = time.time()
+    try:
+        return FetchResult(url, body=get(url), elapsed=time.time() - start)
+    except Exception as e:
+        return FetchResult(url, error=e, elapsed=time.time() - start)
+
+
+def get_many(urls, workers=16):
+    """Fetch many URLs on a bounded pool of keep-alive connections.
+
+    Never raises for a single URL: returns one FetchResult per URL, in the
+    order given, carrying either the body or the error and the time it took.
+    """
+    with futures.ThreadPoolExecutor(max_workers=min(workers, POOL_SIZE)) as pool:
+        results = list(pool.map(_timed_get, urls))
+    evict_pending()
+    return results
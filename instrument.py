@@ -0,0 +1,178 @@
+"""
+Build instrumentation: where the time, memory and requests of a build go.
+
+Every HTTP request made through http_cache's session and every boto call made
+by a client from clients.get_client() is counted, along with the bytes received
+and the retries needed. stage() records, for a block of code, the wall time,
+CPU time, growth of the peak RSS and the change of each counter. The scrape
+pipeline stages and the build tasks are recorded as stages; write_report()
+saves them as JSON and print_summary() prints them as a table. Stages are also
+the scopes of the profiles taken by profiler.py.
+
+Counters and CPU time are process wide. When stages run concurrently each one
+also sees what the others did in the meantime, so run the scrape with
+workers=1 for exact numbers per stage.
+"""
+
+import contextlib
+import json
+import os
+import resource
+import threading
+import time
+
+import profiler
+
+REPORT_FILE = os.getenv("BUILD_REPORT", os.path.join(".cache", "build_report.json"))
+
+COUNTERS = (
+    "http_requests",
+    "http_bytes",
+    "http_retries",
+    "boto_calls",
+    "boto_bytes",
+    "boto_retries",
+)
+
+_lock = threading.Lock()
+_counters = dict.fromkeys(COUNTERS, 0)
+_stages = []
+_started = time.time()
+
+
+def count(counter, n=1):
+    with _lock:
+        _counters[counter] += n
+
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+
+def _peak_rss_kb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def count_http_response(response, *args, **kwargs):
+    """requests response hook counting the request and its body size"""
+    if kwargs.get("stream"):
+        # Don't consume a streamed body, trust the announced length
+        size = int(response.headers.get("Content-Length") or 0)
+    else:
+        size = len(response.content)
+    with _lock:
+        _counters["http_requests"] += 1
+        _counters["http_bytes"] += size
+
+
+def _before_boto_call(**kwargs):
+    count("boto_calls")
+
+
+def _after_boto_call(http_response=None, parsed=None, **kwargs):
+    retries = (parsed or {}).get("ResponseMetadata", {}).get("RetryAttempts", 0)
+    size = 0
+    if http_response is not None:
+        size = int(http_response.headers.get("content-length") or 0)
+    with _lock:
+        _counters["boto_bytes"] += size
+        _counters["boto_retries"] += retries
+
+
+def watch_client(client):
+    """Count the calls of a boto3 client"""
+    client.meta.events.register("before-call", _before_boto_call)
+    client.meta.events.register("after-call", _after_boto_call)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Record wall time, CPU time, peak RSS growth and counters of the block"""
+    before = counters()
+    rss = _peak_rss_kb()
+    cpu = time.process_time()
+    start = time.perf_counter()
+    record = {"name": name, "started": round(time.time() - _started, 3)}
+    try:
+        with profiler.scope(name):
+            yield record
+        record["ok"] = True
+    except BaseException:
+        record["ok"] = False
+        raise
+    finally:
+        record["wall"] = round(time.perf_counter() - start, 3)
+        record["cpu"] = round(time.process_time() - cpu, 3)
+        record["peak_rss_delta_kb"] = _peak_rss_kb() - rss
+        after = counters()
+        for counter in COUNTERS:
+            record[counter] = after[counter] - before[counter]
+        with _lock:
+            _stages.append(record)
+
+
+def report():
+    with _lock:
+        stages = sorted(_stages, key=lambda s: s["started"])
+    return {
+        "wall": round(time.time() - _started, 3),
+        "cpu": round(time.process_time(), 3),
+        "peak_rss_kb": _peak_rss_kb(),
+        "totals": counters(),
+        "stages": stages,
+    }
+
+
+def write_report(path=None):
+    path = path or REPORT_FILE
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report(), f, indent=1)
+    return path
+
+
+def print_summary():
+    data = report()
+    header = (
+        "stage",
+        "wall s",
+        "cpu s",
+        "rss +MiB",
+        "http",
+        "http MiB",
+        "boto",
+        "boto MiB",
+        "retries",
+    )
+    total = dict(
+        data["totals"],
+        name="total",
+        wall=data["wall"],
+        cpu=data["cpu"],
+        peak_rss_delta_kb=data["peak_rss_kb"],
+    )
+    rows = [header]
+    for s in data["stages"] + [total]:
+        rows.append(
+            (
+                s["name"] + ("" if s.get("ok", True) else " (failed)"),
+                "%.1f" % s["wall"],
+                "%.1f" % s["cpu"],
+                "%.1f" % (s["peak_rss_delta_kb"] / 1024),
+                str(s["http_requests"]),
+                "%.1f" % (s["http_bytes"] / 1024**2),
+                str(s["boto_calls"]),
+                "%.1f" % (s["boto_bytes"] / 1024**2),
+                str(s["http_retries"] + s["boto_retries"]),
+            )
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    for row in rows:
+        print(
+            "  ".join(
+                cell.ljust(w) if i == 0 else cell.rjust(w)
+                for i, (cell, w) in enumerate(zip(row, widths))
+            )
+        )
@@ -0,0 +1,147 @@
+"""
+Streaming writers for the instances.json files of the scrapers.
+
+Records are written one at a time, and each record one key at a time, so no
+list of the whole output (or dict per record) has to be built first. A record
+is either a dict or an object with a fields() method yielding its (key, value)
+pairs already sorted, like scrape.Instance.
+
+Output is written to a temporary file next to the target and renamed over it
+once complete, so readers never see a half written file. Formats:
+
+- "pretty" (default): the same bytes as json.dump(records, f, indent=1)
+- "compact": a JSON list without whitespace
+- "ndjson": one compact record per line
+
+OUTPUT_FORMAT picks "pretty" or "compact" for instances.json itself, which has
+to stay a JSON document for render.py. Setting OUTPUT_NDJSON writes an ndjson
+copy next to it (instances.ndjson) for tools that process one instance at a
+time.
+"""
+
+import contextlib
+import json
+import operator
+import os
+import tempfile
+
+FORMATS = ("pretty", "compact", "ndjson")
+# instances.json is json.load()ed by render.py, it has to stay a JSON document
+INSTANCES_FORMATS = ("pretty", "compact")
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "pretty")
+OUTPUT_NDJSON = bool(os.getenv("OUTPUT_NDJSON"))
+
+
+def _check_output_format(format):
+    if format not in INSTANCES_FORMATS:
+        raise ValueError(
+            "OUTPUT_FORMAT must be {}, not {!r} (use OUTPUT_NDJSON for ndjson)".format(
+                " or ".join(INSTANCES_FORMATS), format
+            )
+        )
+
+
+# Fail at startup rather than after the scrape
+_check_output_format(OUTPUT_FORMAT)
+
+
+def _pairs(record, sort_keys):
+    fields = getattr(record, "fields", None)
+    if fields is not None:
+        return fields()
+    if sort_keys:
+        return sorted(record.items(), key=operator.itemgetter(0))
+    return record.items()
+
+
+def _write_pretty(f, records, sort_keys):
+    encoder = json.JSONEncoder(indent=1, sort_keys=sort_keys, separators=(",", ": "))
+    f.write("[")
+    first_record = True
+    for record in records:
+        f.write("\n {" if first_record else ",\n {")
+        first_record = False
+        first = True
+        for key, value in _pairs(record, sort_keys):
+            f.write("\n  " if first else ",\n  ")
+            first = False
+            f.write(encoder.encode(key))
+            f.write(": ")
+            # Values sit two levels deep, indent their lines accordingly. JSON
+            # strings never contain a raw newline, so this only hits structure.
+            f.write(encoder.encode(value).replace("\n", "\n  "))
+        f.write("}" if first else "\n }")
+    f.write("]" if first_record else "\n]")
+
+
+def _compact_record(encoder, record, sort_keys):
+    return "{%s}" % ",".join(
+        "%s:%s" % (encoder.encode(key), encoder.encode(value))
+        for key, value in _pairs(record, sort_keys)
+    )
+
+
+def _write_compact(f, records, sort_keys):
+    encoder = json.JSONEncoder(sort_keys=sort_keys, separators=(",", ":"))
+    f.write("[")
+    first = True
+    for record in records:
+        if not first:
+            f.write(",")
+        first = False
+        f.write(_compact_record(encoder, record, sort_keys))
+    f.write("]")
+
+
+def _write_ndjson(f, records, sort_keys):
+    encoder = json.JSONEncoder(sort_keys=sort_keys, separators=(",", ":"))
+    for record in records:
+        f.write(_compact_record(encoder, record, sort_keys))
+        f.write("\n")
+
+
+WRITERS = {
+    "pretty": _write_pretty,
+    "compact": _write_compact,
+    "ndjson": _write_ndjson,
+}
+
+
+@contextlib.contextmanager
+def atomic_open(path):
+    """Open a text file that replaces path only if the block succeeds"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            yield f
+        # mkstemp creates the file 0600, keep the usual permissions
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp, 0o666 & ~umask)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_json(path, records, format="pretty", sort_keys=False):
+    """Write records to path in the given format"""
+    if format not in WRITERS:
+        raise ValueError(
+            "Unknown output format {!r}, expected one of {}".format(
+                format, ", ".join(FORMATS)
+            )
+        )
+    with atomic_open(path) as f:
+        WRITERS[format](f, records, sort_keys)
+
+
+def write_instances(path, records, sort_keys=False):
+    """Write an instances.json, and its ndjson copy if OUTPUT_NDJSON is set"""
+    _check_output_format(OUTPUT_FORMAT)
+    write_json(path, records, OUTPUT_FORMAT, sort_keys)
+    if OUTPUT_NDJSON:
+        ndjson_path = os.path.splitext(path)[0] + ".ndjson"
+        write_json(ndjson_path, records, "ndjson", sort_keys)
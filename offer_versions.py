@@ -0,0 +1,77 @@
+"""
+Incremental scrapes keyed on Price List offer versions.
+
+Each service's Price List version index names the current version of its offer
+file (see offers.offer_version()). A scraper run in incremental mode records the versions its output was
+built from in STATE_FILE, and skips the whole service on the next build if
+none of them changed and its previous output is still there.
+
+Only the offer files are checked: documentation pages and API data the
+scrapers also use (spot prices in particular) are refreshed when an offer
+changes or on a full build.
+"""
+
+import json
+import os
+import threading
+
+import offers
+
+STATE_FILE = os.getenv(
+    "OFFER_VERSIONS_FILE", os.path.join(".cache", "offer_versions.json")
+)
+
+_lock = threading.Lock()
+
+
+def _load_state():
+    try:
+        with open(STATE_FILE, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print("WARNING: Ignoring unreadable {}: {!r}".format(STATE_FILE, e))
+        return {}
+
+
+class OfferVersions(object):
+    """Versions of the offers output_file is built from"""
+
+    def __init__(self, output_file, service_codes):
+        self.output_file = output_file
+        try:
+            self.versions = {code: offers.offer_version(code) for code in service_codes}
+        except Exception as e:
+            print(
+                "WARNING: Unable to get offer versions of {}, scraping everything: {!r}".format(
+                    ", ".join(service_codes), e
+                )
+            )
+            self.versions = None
+
+    def unchanged(self):
+        """True if output_file was already built from the current versions"""
+        if self.versions is None or not os.path.exists(self.output_file):
+            return False
+        if _load_state().get(self.output_file) != self.versions:
+            return False
+        print(
+            "Offers unchanged ({}), keeping {}".format(
+                ", ".join("%s %s" % v for v in sorted(self.versions.items())),
+                self.output_file,
+            )
+        )
+        return True
+
+    def record(self):
+        """Remember that output_file was built from the current versions"""
+        if self.versions is None:
+            return
+        with _lock:
+            state = _load_state()
+            state[self.output_file] = self.versions
+            os.makedirs(os.path.dirname(STATE_FILE) or ".", exist_ok=True)
+            with open(STATE_FILE + ".tmp", "w") as f:
+                json.dump(state, f, indent=1, sort_keys=True)
+            os.replace(STATE_FILE + ".tmp", STATE_FILE)
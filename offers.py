@@ -0,0 +1,218 @@
+"""
+Streaming reader for AWS Price List bulk offer files.
+
+An offer file looks like
+
+    {
+        "formatVersion": "v1.0", "publicationDate": "...", ...,
+        "products": {sku: product, ...},
+        "terms": {
+            "OnDemand": {sku: {offerTermCode: term, ...}, ...},
+            "Reserved": {sku: {offerTermCode: term, ...}, ...}
+        }
+    }
+
+and can be several GB for EC2. iter_offer_file() walks it with an incremental
+parser and only builds the small per-SKU objects one at a time, so memory
+scales with what the caller keeps rather than with the size of the file.
+"""
+
+import contextlib
+import functools
+import json
+
+import ijson
+
+import download
+import http_cache
+
+PRICING_HOST = "https://pricing.us-east-1.amazonaws.com"
+
+# Containers of per-SKU objects and the event kind reported for their items
+SECTIONS = {
+    "products": "product",
+    "terms.OnDemand": "OnDemand",
+    "terms.Reserved": "Reserved",
+}
+
+
+def offer_url(service_code, region=None):
+    """URL of the current offer file of a service, or of one of its regions"""
+    if region:
+        return (
+            f"{PRICING_HOST}/offers/v1.0/aws/{service_code}/current/{region}/index.json"
+        )
+    return f"{PRICING_HOST}/offers/v1.0/aws/{service_code}/current/index.json"
+
+
+def region_offer_urls(service_code):
+    """URLs of the current per-region offer files of a service, sorted by region"""
+    url = f"{PRICING_HOST}/offers/v1.0/aws/{service_code}/current/region_index.json"
+    regions = json.loads(http_cache.get(url))["regions"]
+    return [PRICING_HOST + regions[r]["currentVersionUrl"] for r in sorted(regions)]
+
+
+@functools.lru_cache(maxsize=None)
+def _offer_index():
+    return json.loads(http_cache.get(f"{PRICING_HOST}/offers/v1.0/aws/index.json"))
+
+
+def offer_version(service_code):
+    """Version of the current offer file of a service, e.g. "20240312203004"
+
+    The offer index, fetched once per process, only links the current/ files of
+    a service. Its version index (e.g. /offers/v1.0/aws/AmazonRDS/index.json)
+    names the version they are.
+    """
+    url = _offer_index()["offers"][service_code]["versionIndexUrl"]
+    return json.loads(http_cache.get(PRICING_HOST + url))["currentVersion"]
+
+
+@contextlib.contextmanager
+def open_offer_file(source):
+    """Open an offer file from a local path or a URL as a binary stream.
+
+    URLs are first spooled to disk with download.download(), which resumes
+    interrupted transfers and reuses the file while it is unchanged upstream.
+    """
+    if source.startswith("http://") or source.startswith("https://"):
+        with download.open_download(download.download(source)) as f:
+            yield f
+    else:
+        with open(source, "rb") as f:
+            yield f
+
+
+def make_product_filter(product_families=None, product_filter=None):
+    """Combine a productFamily selection and a predicate into one, or None"""
+    if product_families is None:
+        return product_filter
+    product_families = frozenset(product_families)
+
+    def accept(product):
+        if product.get("productFamily") not in product_families:
+            return False
+        return product_filter is None or product_filter(product)
+
+    return accept
+
+
+def iter_offer_file(f, product_filter=None, product_families=None, skus=None):
+    """Yield (kind, key, value) events from an offer file stream.
+
+    kind is "header" for top level scalars like publicationDate (key is the
+    field name), and "product", "OnDemand" or "Reserved" for the per-SKU
+    objects (key is the SKU). Events come in file order, i.e. all products
+    before any terms.
+
+    Products can be selected by productFamily, by SKU and/or with a
+    product_filter predicate. Only the selected products are yielded, and
+    terms of the other SKUs are skipped without being built.
+    """
+    product_filter = make_product_filter(product_families, product_filter)
+    if skus is not None:
+        skus = frozenset(skus)
+    filtering = product_filter is not None or skus is not None
+    accepted = set()
+    builder = None
+    skipping = False
+    kind = key = None
+    depth = 0
+    for prefix, event, value in ijson.parse(f, use_float=True):
+        if builder is not None or skipping:
+            if builder is not None:
+                builder.event(event, value)
+            if event in ("start_map", "start_array"):
+                depth += 1
+            elif event in ("end_map", "end_array"):
+                depth -= 1
+            if depth > 0:
+                continue
+            if skipping:
+                skipping = False
+            elif kind != "product" or not filtering:
+                yield kind, key, builder.value
+            elif product_filter is None or product_filter(builder.value):
+                accepted.add(key)
+                yield kind, key, builder.value
+            builder = None
+            continue
+
+        if event == "map_key" and prefix in SECTIONS:
+            kind, key = SECTIONS[prefix], value
+            if kind == "product" and skus is not None and key not in skus:
+                skipping = True
+            elif kind != "product" and filtering and key not in accepted:
+                skipping = True
+            else:
+                builder = ijson.ObjectBuilder()
+        elif event in ("string", "number", "boolean", "null") and "." not in prefix:
+            yield "header", prefix, value
+
+
+def read_offer_file(source, **kwargs):
+    """iter_offer_file() over a path or URL, closing it once exhausted"""
+    with open_offer_file(source) as f:
+        for event in iter_offer_file(f, **kwargs):
+            yield event
+
+
+class OfferReader(object):
+    """Single pass over an offer file, handed out one section at a time.
+
+        reader = OfferReader(source, product_families=["Database Instance"])
+        for sku, product in reader.products():
+            ...
+        for sku, terms in reader.terms("OnDemand"):
+            ...
+        for sku, terms in reader.terms("Reserved"):
+            ...
+
+    Sections have to be asked for in the order they appear in the file,
+    which for AWS offer files is products, OnDemand, Reserved. Asking for a
+    section that is not next yields nothing; a section showing up after it
+    was asked for raises ValueError rather than being silently dropped.
+    Top level scalars like publicationDate are collected in `headers`.
+    """
+
+    def __init__(self, source, **kwargs):
+        self.source = source
+        self.headers = {}
+        self._events = read_offer_file(source, **kwargs)
+        self._pending = None
+        self._passed = set()
+
+    def _next(self):
+        if self._pending is not None:
+            event, self._pending = self._pending, None
+            return event
+        for kind, key, value in self._events:
+            if kind == "header":
+                self.headers[key] = value
+                continue
+            return kind, key, value
+        return None
+
+    def section(self, kind):
+        """Yield (sku, value) for each item of the next section if it is `kind`"""
+        while True:
+            event = self._next()
+            if event is None:
+                break
+            if event[0] != kind:
+                if event[0] in self._passed:
+                    raise ValueError(
+                        "{}: {} section found after it was read".format(
+                            self.source, event[0]
+                        )
+                    )
+                self._pending = event
+                break
+            yield event[1], event[2]
+        self._passed.add(kind)
+
+    def products(self):
+        return self.section("product")
+
+    def terms(self, term_type):
+        return self.section(term_type)
@@ -1,15 +1,17 @@
 #!/usr/bin/env python
-import requests
-import json
 from json import encoder
 import sys
 from lxml import etree
-from six.moves.urllib import request as urllib2
 
 import six
 from tqdm import tqdm
 
 import ec2
+import docs
+import json_output
+import offer_versions
+import offers
+import regions
 
 
 def add_pretty_names(instances):
@@ -66,9 +68,9 @@ def add_pretty_names(instances):
 
 def add_volume_quotas(instances):
     os_quotas_url = "https://docs.aws.amazon.com/opensearch-service/latest/developerguide/limits.html"
-    tree = etree.parse(urllib2.urlopen(os_quotas_url), etree.HTMLParser())
-    table = tree.xpath('//div[@class="table-contents disable-scroll"]//table')[1]
-    rows = table.xpath(".//tr[./td]")
+    document = docs.get(os_quotas_url)
+    tables = '//div[@class="table-contents disable-scroll"]//table'
+    rows = document.rows(1, tables)
 
     for r in rows:
         instance_type = etree.tostring(r[0], method="text").strip().decode()
@@ -80,8 +82,7 @@ def add_volume_quotas(instances):
         instances[instance_type]["max_ebs_gp2"] = max_ebs_gp2
         instances[instance_type]["max_ebs_gp3"] = max_ebs_gp3
 
-    table = tree.xpath('//div[@class="table-contents disable-scroll"]//table')[2]
-    rows = table.xpath(".//tr[./td]")
+    rows = document.rows(2, tables)
     for r in rows:
         instance_type = etree.tostring(r[0], method="text").strip().decode()
         max_http_payload = etree.tostring(r[1], method="text").strip().decode()
@@ -93,24 +94,28 @@ def add_volume_quotas(instances):
     instances["ultrawarm1.large.search"]["max_storage"] = "20 TiB"
 
 
-def scrape(output_file, input_file=None):
+def scrape(output_file, input_file=None, incremental=False):
+    # skip the scrape if the offer file did not change since the last build
+    versions = None
+    if incremental and not input_file:
+        versions = offer_versions.OfferVersions(output_file, ["AmazonES"])
+        if versions.unchanged():
+            return
+
     # if an argument is given, use that as the path for the json file
-    if input_file:
-        with open(input_file) as json_data:
-            data = json.load(json_data)
-    else:
-        price_index = "https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/AmazonES/current/index.json"
-        index = requests.get(price_index)
-        data = index.json()
+    reader = offers.OfferReader(
+        input_file or offers.offer_url("AmazonES"),
+        product_families=["Amazon OpenSearch Service Instance"],
+    )
 
     caches_instances = {}
     instances = {}
 
     # region mapping, someone thought it was handy not to include the region id's :(
-    regions = ec2.get_region_descriptions()
+    registry = regions.get_registry().copy()
 
     # loop through products, and only fetch available instances for now
-    for sku, product in tqdm(six.iteritems(data["products"])):
+    for sku, product in tqdm(reader.products()):
         if (
             product.get("productFamily", None) == "Amazon OpenSearch Service Instance"
             and product.get("attributes", {}).get("operation", None)
@@ -127,12 +132,10 @@ def scrape(output_file, input_file=None):
                 # at one point this region was local but was upgraded to a standard region
                 # however some SKUs still reference the old region
                 region = "ap-northeast-3"
-                regions[location] = region
-            elif location not in regions.values():
-                region = attributes["regionCode"]
-                regions[location] = region
+                registry.add(location, region)
             else:
-                region = regions[location]
+                region = attributes["regionCode"]
+                registry.add(location, region)
 
             # set the attributes in line with the ec2 index
             attributes["region"] = region
@@ -160,8 +163,8 @@ def scrape(output_file, input_file=None):
                 instances[instance_type] = new_attributes
 
     # Parse ondemand pricing
-    for sku, offers in six.iteritems(data["terms"]["OnDemand"]):
-        for code, offer in six.iteritems(offers):
+    for sku, terms in reader.terms("OnDemand"):
+        for code, offer in six.iteritems(terms):
             for key, dimension in six.iteritems(offer["priceDimensions"]):
                 # skip these types of charges
                 if any(
@@ -193,13 +196,9 @@ def scrape(output_file, input_file=None):
                 }
 
                 # build the list of regions where each instance is available
-                # we have to do a reverse lookup from the regions list
-                l = ""
-                for l, r in regions.items():
-                    if instance["region"] == r:
-                        location = l
-                        break
-                instances[instance["instance_type"]]["regions"][instance["region"]] = l
+                instances[instance["instance_type"]]["regions"][instance["region"]] = (
+                    registry.name(instance["region"], "")
+                )
 
     reserved_mapping = {
         "1yr All Upfront": "yrTerm1.allUpfront",
@@ -211,8 +210,8 @@ def scrape(output_file, input_file=None):
     }
 
     # Parse reserved pricing
-    for sku, offers in six.iteritems(data["terms"]["Reserved"]):
-        for code, offer in six.iteritems(offers):
+    for sku, terms in reader.terms("Reserved"):
+        for code, offer in six.iteritems(terms):
             for key, dimension in six.iteritems(offer["priceDimensions"]):
                 # print()
                 # print()
@@ -303,8 +302,10 @@ def scrape(output_file, input_file=None):
 
     # write output to file
     encoder.FLOAT_REPR = lambda o: format(o, ".5f")
-    with open(output_file, "w+") as outfile:
-        json.dump(list(instances.values()), outfile, indent=1)
+    json_output.write_instances(output_file, instances.values())
+
+    if versions:
+        versions.record()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+"""
+Join of offer file terms onto the instance pricing cells of a service scraper.
+
+Products are registered once with the (instance type, region) they price and
+the engine keys their price goes under. Terms are then looked up by SKU only,
+their price dimensions classified with one compiled pattern, and the prices
+collected per (instance type, region, engine) cell. apply() writes every cell
+into the instances in one go, in the order the cells were first priced.
+"""
+
+import re
+
+# On-demand dimensions that are not the hourly instance price
+SKIPPED_DIMENSIONS = re.compile(
+    "transfer|global|storage|iops|requests|multi-az", re.IGNORECASE
+)
+
+
+class PriceJoin(object):
+    def __init__(self, reserved_mapping, skipped=SKIPPED_DIMENSIONS):
+        self.reserved_mapping = reserved_mapping
+        self.skipped = skipped
+        self.skus = {}
+        self.cells = {}
+        self.available = {}
+
+    def add_sku(self, sku, instance_type, region, ondemand_engines, reserved_engines):
+        """Price terms of sku under the given engine keys of instance_type/region"""
+        self.skus[sku] = (
+            instance_type,
+            region,
+            tuple(ondemand_engines),
+            tuple(reserved_engines),
+        )
+
+    def _cell(self, instance_type, region, engine):
+        key = (instance_type, region, engine)
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = {}
+        return cell
+
+    def add_ondemand(self, sku, terms):
+        target = self.skus.get(sku)
+        if target is None:
+            return
+        instance_type, region, engines, _ = target
+        for offer in terms.values():
+            for dimension in offer["priceDimensions"].values():
+                if self.skipped.search(dimension["description"]):
+                    continue
+                price = float(dimension["pricePerUnit"]["USD"])
+                for engine in engines:
+                    self._cell(instance_type, region, engine)["ondemand"] = price
+                self.available[(instance_type, region)] = True
+
+    def add_reserved(self, sku, terms):
+        target = self.skus.get(sku)
+        if target is None:
+            return
+        instance_type, region, _, engines = target
+        for offer in terms.values():
+            term = self.reserved_mapping[
+                "%s %s"
+                % (
+                    offer["termAttributes"]["LeaseContractLength"],
+                    offer["termAttributes"]["PurchaseOption"],
+                )
+            ]
+            for dimension in offer["priceDimensions"].values():
+                key = "%s-%s" % (term, dimension["unit"].lower())
+                price = float(dimension["pricePerUnit"]["USD"])
+                for engine in engines:
+                    cell = self._cell(instance_type, region, engine)
+                    cell.setdefault("reserved", {})[key] = price
+
+    def apply(self, instances, registry):
+        """Write the collected cells and available regions into instances"""
+        for (instance_type, region, engine), cell in self.cells.items():
+            pricing = instances[instance_type]["pricing"]
+            pricing.setdefault(region, {})[engine] = cell
+        for instance_type, region in self.available:
+            instances[instance_type]["regions"][region] = registry.name(region, "")
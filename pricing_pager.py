@@ -0,0 +1,139 @@
+"""
+Throttle-aware pager for the Pricing API get_products call.
+
+botocore's generic retry backs off each call on its own, so a burst of
+ThrottlingExceptions stalls the whole run. ProductPager instead paces every
+request through a TokenBucket shared by all pagers: the rate is halved when
+AWS throttles us and grows back slowly while calls succeed, so we settle close
+to whatever rate the account allows.
+"""
+
+import random
+import threading
+import time
+
+import botocore.exceptions
+
+import clients
+import instrument
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket with an additive-increase/multiplicative-decrease rate"""
+
+    def __init__(self, rate=5.0, min_rate=0.5, max_rate=40.0, increase=0.2):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.tokens = 1.0
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the caller may send one request"""
+        with self.lock:
+            now = time.monotonic()
+            burst = max(1.0, self.rate)
+            self.tokens = min(burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # Reserve the token now and sleep outside the lock until it is ours
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+    def throttled(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+
+# Shared by every pager so concurrent queries split the account's allowance
+pricing_bucket = TokenBucket()
+
+
+class ProductPager(object):
+    def __init__(self, client=None, bucket=None, max_attempts=10):
+        if client is None:
+            # Retries are handled here, don't let botocore retry behind our back
+            client = clients.get_client(
+                "pricing",
+                region_name="us-east-1",
+                retries={"mode": "standard", "max_attempts": 1},
+            )
+        self.client = client
+        self.bucket = bucket or pricing_bucket
+        self.max_attempts = max_attempts
+        self.pages = 0
+        self.retries = 0
+        self.throttles = 0
+        self.started = None
+        self.finished = None
+
+    def paginate(self, **kwargs):
+        """Yield get_products responses, like botocore's paginator would"""
+        self.started = time.monotonic()
+        params = dict(kwargs)
+        while True:
+            page = self._get_products(params)
+            self.pages += 1
+            yield page
+            next_token = page.get("NextToken")
+            if not next_token:
+                break
+            params["NextToken"] = next_token
+        self.finished = time.monotonic()
+
+    def _get_products(self, params):
+        for attempt in range(1, self.max_attempts + 1):
+            self.bucket.acquire()
+            try:
+                page = self.client.get_products(**params)
+            except botocore.exceptions.ClientError as e:
+                if e.response["Error"]["Code"] not in clients.THROTTLING_ERRORS:
+                    raise
+                if attempt == self.max_attempts:
+                    raise
+                self.throttles += 1
+                self.bucket.throttled()
+            except (
+                botocore.exceptions.ConnectionError,
+                botocore.exceptions.HTTPClientError,
+            ):
+                if attempt == self.max_attempts:
+                    raise
+            else:
+                self.bucket.succeeded()
+                return page
+            self.retries += 1
+            instrument.count("boto_retries")
+            time.sleep(min(30, 0.1 * 2**attempt) * random.random())
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def pages_per_second(self):
+        return self.pages / self.elapsed if self.elapsed else 0.0
+
+    def stats(self):
+        return {
+            "pages": self.pages,
+            "retries": self.retries,
+            "throttles": self.throttles,
+            "elapsed": round(self.elapsed, 3),
+            "pages_per_second": round(self.pages_per_second, 2),
+            "rate": round(self.bucket.rate, 2),
+        }
+
+    def __str__(self):
+        return "{pages} pages in {elapsed}s ({pages_per_second} pages/s, {retries} retries, {throttles} throttled, rate now {rate}/s)".format(
+            **self.stats()
+        )
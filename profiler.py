@@ -0,0 +1,243 @@
+"""
+Profiling of build tasks, scoped by instrument stage.
+
+Enabled with --profile on the invoke tasks, or for any of them with
+BUILD_PROFILE set to the profilers to run:
+
+- cprofile: a cProfile profile per stage, saved as <stage>.pstats. Each stage
+  holds only what ran outside its sub-stages, all.pstats has everything.
+- sample: every PROFILE_INTERVAL seconds the Python stack of each thread in a
+  stage is sampled. Samples are saved as collapsed stacks, one line per stack
+  with its count and the stage path as outermost frames, as read by
+  flamegraph.pl and speedscope: <stage>.folded for the samples taken in that
+  stage and all.folded for all of them.
+
+--profile alone, or BUILD_PROFILE=1, runs both. Files go to a directory per run
+under PROFILE_DIR.
+
+cProfile only sees the thread it is enabled in, so stages running in worker
+threads get their own profiles. Pythons where only one cProfile can be active
+at a time (3.12 and later) skip the stages that start while another one runs,
+run the scrape with workers=1 to profile all of them. The sampler sees every
+thread; threads outside any stage, like idle pool workers, are not sampled.
+"""
+
+import cProfile
+import collections
+import contextlib
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+
+PROFILE = os.getenv("BUILD_PROFILE", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(".cache", "profiles"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILERS = ("cprofile", "sample")
+
+_lock = threading.Lock()
+_local = threading.local()
+_profilers = frozenset()
+# thread ident -> stack of (stage path, cProfile.Profile or None) of the thread
+_threads = {}
+# stage name -> profiles of the stage
+_profiles = collections.defaultdict(list)
+# (stage path, code objects from the outermost frame) -> samples
+_samples = collections.Counter()
+_sampler = None
+_warned = False
+
+
+def parse_profilers(value):
+    """The profilers to run for a --profile or BUILD_PROFILE value"""
+    if value is True or value in ("1", "true", "yes"):
+        return frozenset(PROFILERS)
+    if not value:
+        return frozenset()
+    profilers = frozenset(p.strip() for p in value.split(",") if p.strip())
+    unknown = profilers.difference(PROFILERS)
+    if unknown:
+        raise ValueError(
+            "Unknown profiler {}, expected {}".format(
+                ", ".join(sorted(unknown)), " or ".join(PROFILERS)
+            )
+        )
+    return profilers
+
+
+def _enable(profile):
+    global _warned
+    try:
+        profile.enable()
+        return True
+    except ValueError as e:
+        # Another thread's profile is active, see the module docstring
+        if not _warned:
+            _warned = True
+            print(
+                "WARNING: Not profiling concurrent stages with cProfile: {}".format(e)
+            )
+        return False
+
+
+@contextlib.contextmanager
+def scope(name):
+    """Attribute what runs in the block to stage name, if profiling"""
+    if not _profilers:
+        yield
+        return
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+        with _lock:
+            _threads[threading.get_ident()] = stack
+    parent = stack[-1] if stack else None
+    path = parent[0] + (name,) if parent else (name,)
+    profile = None
+    if "cprofile" in _profilers:
+        if parent is not None and parent[1] is not None:
+            parent[1].disable()
+        profile = cProfile.Profile()
+        if not _enable(profile):
+            profile = None
+    stack.append((path, profile))
+    try:
+        yield
+    finally:
+        stack.pop()
+        if profile is not None:
+            profile.disable()
+            with _lock:
+                _profiles[name].append(profile)
+        if parent is not None and parent[1] is not None:
+            _enable(parent[1])
+
+
+def _sample(interval, stopped):
+    me = threading.get_ident()
+    while not stopped.wait(interval):
+        frames = sys._current_frames()
+        with _lock:
+            stacks = [(ident, s[-1][0]) for ident, s in _threads.items() if s]
+        for ident, path in stacks:
+            frame = frames.get(ident)
+            if frame is None or ident == me:
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            codes.reverse()
+            _samples[(path, tuple(codes))] += 1
+
+
+def start(profilers):
+    global _profilers, _sampler
+    _profilers = frozenset(profilers)
+    if "sample" in _profilers:
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=_sample, args=(PROFILE_INTERVAL, stop), daemon=True
+        )
+        thread.start()
+        _sampler = (thread, stop)
+
+
+def stop():
+    global _profilers, _sampler
+    if _sampler is not None:
+        thread, event = _sampler
+        event.set()
+        thread.join()
+        _sampler = None
+    _profilers = frozenset()
+
+
+def _filename(name):
+    return re.sub(r"[^\w.-]+", "_", name).strip("_") or "stage"
+
+
+def _frame_name(code):
+    return "{} ({}:{})".format(
+        code.co_name, os.path.basename(code.co_filename), code.co_firstlineno
+    )
+
+
+def _write_folded(path, samples):
+    with open(path, "w") as f:
+        for line, count in sorted(samples.items()):
+            f.write("{} {}\n".format(line, count))
+
+
+def write(directory):
+    """Save the collected profiles to directory, return the files written"""
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    with _lock:
+        profiles = dict(_profiles)
+        samples = dict(_samples)
+        _profiles.clear()
+        _samples.clear()
+
+    if profiles:
+        everything = None
+        for name, stage_profiles in sorted(profiles.items()):
+            stats = pstats.Stats(*stage_profiles)
+            path = os.path.join(directory, _filename(name) + ".pstats")
+            stats.dump_stats(path)
+            written.append(path)
+            if everything is None:
+                everything = pstats.Stats(*stage_profiles)
+            else:
+                everything.add(*stage_profiles)
+        path = os.path.join(directory, "all.pstats")
+        everything.dump_stats(path)
+        written.append(path)
+
+    if samples:
+        by_stage = collections.defaultdict(collections.Counter)
+        everything = collections.Counter()
+        for (stage_path, codes), count in samples.items():
+            line = ";".join(
+                ["[{}]".format(name) for name in stage_path]
+                + [_frame_name(code) for code in codes]
+            )
+            by_stage[stage_path[-1]][line] += count
+            everything[line] += count
+        for name, stage_samples in sorted(by_stage.items()):
+            path = os.path.join(directory, _filename(name) + ".folded")
+            _write_folded(path, stage_samples)
+            written.append(path)
+        path = os.path.join(directory, "all.folded")
+        _write_folded(path, everything)
+        written.append(path)
+    return written
+
+
+@contextlib.contextmanager
+def session(name, profile=None):
+    """Profile the block as stage name with the profilers asked for.
+
+    profile is the --profile value of a task; when None, BUILD_PROFILE decides.
+    Tasks run by another task that is profiled are part of its session.
+    """
+    if _profilers:
+        yield
+        return
+    profilers = parse_profilers(PROFILE if profile is None else profile)
+    if not profilers:
+        yield
+        return
+    directory = os.path.join(
+        PROFILE_DIR, "{}-{}".format(_filename(name), time.strftime("%Y%m%d-%H%M%S"))
+    )
+    start(profilers)
+    try:
+        with scope(name):
+            yield
+    finally:
+        stop()
+        written = write(directory)
+        print("Profiles written to {} ({} files)".format(directory, len(written)))
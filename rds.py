@@ -1,15 +1,15 @@
 #!/usr/bin/env python
-import requests
-import json
 from json import encoder
 import sys
 import six
-import os
 import ec2
 import locale
-import re
-from lxml import etree
-from six.moves.urllib import request as urllib2
+import docs
+import json_output
+import offer_versions
+import offers
+import price_join
+import regions
 
 
 locale.setlocale(locale.LC_ALL, "en_US.UTF-8")
@@ -62,26 +62,6 @@ def add_pretty_names(instances):
         i["pretty_name"] = " ".join([b for b in bits if b])
 
 
-def sanitize_instance_type(instance_type):
-    """Typos and other bad data are common in the instance type colums for some reason"""
-    # Remove random whitespace
-    instance_type = re.sub(r"\s+", "", instance_type, flags=re.UNICODE)
-
-    # Correct typos
-    typo_corrections = {
-        "x1.16large": "x1.16xlarge",  # https://github.com/powdahound/ec2instances.info/issues/199
-        "i3.4xlxarge": "i3.4xlarge",  # https://github.com/powdahound/ec2instances.info/issues/227
-        "i3.16large": "i3.16xlarge",  # https://github.com/powdahound/ec2instances.info/issues/227
-        "p4d.2xlarge": "p4d.24xlarge",  # as of 2020-11-15
-    }
-    return typo_corrections.get(instance_type, instance_type)
-
-
-def totext(elt):
-    s = etree.tostring(elt, method="text", encoding="unicode").strip()
-    return re.sub(r"\*\d$", "", s)
-
-
 def add_ebs_info(instances):
     """
     Six tables on this page:
@@ -102,27 +82,26 @@ def add_ebs_info(instances):
 
     """
 
-    def parse_ebs_combined_table(by_type, table):
-        for row in table.xpath("tr"):
-            if row.xpath("th"):
-                continue
-            cols = row.xpath("td")
-            instance_type = sanitize_instance_type(totext(cols[0]))[:-1]
+    def parse_ebs_combined_table(by_type, document, index):
+        for cols in document.text_rows(
+            index, rows="tr[not(th)]", instance_type_column=0
+        ):
+            instance_type = cols[0][:-1]
 
             if len(cols) == 4:
-                ebs_baseline_bandwidth = locale.atof(totext(cols[1]))
-                ebs_baseline_throughput = locale.atof(totext(cols[2]))
-                ebs_baseline_iops = locale.atof(totext(cols[3]))
-                ebs_max_bandwidth = locale.atof(totext(cols[1]))
-                ebs_throughput = locale.atof(totext(cols[2]))
-                ebs_iops = locale.atof(totext(cols[3]))
+                ebs_baseline_bandwidth = locale.atof(cols[1])
+                ebs_baseline_throughput = locale.atof(cols[2])
+                ebs_baseline_iops = locale.atof(cols[3])
+                ebs_max_bandwidth = locale.atof(cols[1])
+                ebs_throughput = locale.atof(cols[2])
+                ebs_iops = locale.atof(cols[3])
             elif len(cols) == 7:
-                ebs_baseline_bandwidth = locale.atof(totext(cols[1]))
-                ebs_max_bandwidth = locale.atof(totext(cols[2]))
-                ebs_baseline_throughput = locale.atof(totext(cols[3]))
-                ebs_throughput = locale.atof(totext(cols[4]))
-                ebs_baseline_iops = locale.atof(totext(cols[5]))
-                ebs_iops = locale.atof(totext(cols[6]))
+                ebs_baseline_bandwidth = locale.atof(cols[1])
+                ebs_max_bandwidth = locale.atof(cols[2])
+                ebs_baseline_throughput = locale.atof(cols[3])
+                ebs_throughput = locale.atof(cols[4])
+                ebs_baseline_iops = locale.atof(cols[5])
+                ebs_iops = locale.atof(cols[6])
 
             instance_type = "db." + instance_type
             if instance_type in by_type:
@@ -139,15 +118,14 @@ def add_ebs_info(instances):
                 by_type[instance_type]["ebs_iops"] = ebs_iops
                 by_type[instance_type]["ebs_max_bandwidth"] = ebs_max_bandwidth
 
-    def parse_ebs_nondefault_table(by_type, table):
-        for row in table.xpath("tr"):
-            if row.xpath("th"):
-                continue
-            cols = row.xpath("td")
-            instance_type = sanitize_instance_type(totext(cols[0]))[:-1]
-            ebs_max_bandwidth = locale.atof(totext(cols[1]))
-            ebs_throughput = locale.atof(totext(cols[2]))
-            ebs_iops = locale.atof(totext(cols[3]))
+    def parse_ebs_nondefault_table(by_type, document, index):
+        for cols in document.text_rows(
+            index, rows="tr[not(th)]", instance_type_column=0
+        ):
+            instance_type = cols[0][:-1]
+            ebs_max_bandwidth = locale.atof(cols[1])
+            ebs_throughput = locale.atof(cols[2])
+            ebs_iops = locale.atof(cols[3])
 
             instance_type = "db." + instance_type
             if instance_type not in by_type:
@@ -164,32 +142,44 @@ def add_ebs_info(instances):
     # Canonical URL for this info is https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/ebs-optimized.html
     # ebs_url = "https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/ebs-optimized.partial.html"
     ebs_url = "https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/ebs-optimized.html"
-    tree = etree.parse(urllib2.urlopen(ebs_url), etree.HTMLParser())
-    tables = tree.xpath('//div[@class="table-contents"]//table')
+    document = docs.get(ebs_url)
     for t in [0, 1, 2, 3, 4]:
-        parse_ebs_combined_table(by_type, tables[t])
+        parse_ebs_combined_table(by_type, document, t)
+
+    parse_ebs_nondefault_table(by_type, document, 5)
 
-    parse_ebs_nondefault_table(by_type, tables[5])
 
+def scrape(output_file, input_file=None, incremental=False):
+    # skip the scrape if the offer file did not change since the last build
+    versions = None
+    if incremental and not input_file:
+        versions = offer_versions.OfferVersions(output_file, ["AmazonRDS"])
+        if versions.unchanged():
+            return
 
-def scrape(output_file, input_file=None):
     # if an argument is given, use that as the path for the json file
-    if input_file:
-        with open(input_file) as json_data:
-            data = json.load(json_data)
-    else:
-        price_index = "https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/AmazonRDS/current/index.json"
-        index = requests.get(price_index)
-        data = index.json()
-
-    rds_instances = {}
+    reader = offers.OfferReader(
+        input_file or offers.offer_url("AmazonRDS"),
+        product_families=["Database Instance"],
+    )
+
+    reserved_mapping = {
+        "3yr Partial Upfront": "yrTerm3.partialUpfront",
+        "1yr Partial Upfront": "yrTerm1.partialUpfront",
+        "3yr All Upfront": "yrTerm3.allUpfront",
+        "1yr All Upfront": "yrTerm1.allUpfront",
+        "1yr No Upfront": "yrTerm1.noUpfront",
+        "3yr No Upfront": "yrTerm3.noUpfront",
+    }
+
+    join = price_join.PriceJoin(reserved_mapping)
     instances = {}
 
     # region mapping, someone thought it was handy not to include the region id's :(
-    regions = ec2.get_region_descriptions()
+    registry = regions.get_registry().copy()
 
     # loop through products, and only fetch available instances for now
-    for sku, product in six.iteritems(data["products"]):
+    for sku, product in reader.products():
         if product.get("productFamily", None) == "Database Instance":
             attributes = product["attributes"]
 
@@ -207,12 +197,10 @@ def scrape(output_file, input_file=None):
                 # at one point this region was local but was upgraded to a standard region
                 # however some SKUs still reference the old region
                 region = "ap-northeast-3"
-                regions[location] = region
-            elif location not in regions.values():
-                region = attributes["regionCode"]
-                regions[location] = region
+                registry.add(location, region)
             else:
-                region = regions[location]
+                region = attributes["regionCode"]
+                registry.add(location, region)
 
             # set the attributes in line with the ec2 index
             attributes["region"] = region
@@ -234,7 +222,20 @@ def scrape(output_file, input_file=None):
                 continue
 
             if attributes["engineCode"] not in ["210", "220"]:
-                rds_instances[sku] = attributes
+                if attributes["storage"] == "Aurora IO Optimization Mode":
+                    ondemand_engine = "211"
+                else:
+                    ondemand_engine = attributes["engineCode"]
+                # keep pricing under database_engine for backwards compatibility,
+                # even though it's wrong (database_engine is not unique, so
+                # multiple offerings overlap)
+                join.add_sku(
+                    sku,
+                    instance_type,
+                    region,
+                    [ondemand_engine, attributes["database_engine"]],
+                    [attributes["database_engine"], attributes["engineCode"]],
+                )
 
                 if instance_type not in instances.keys():
                     # delete some attributes that are inconsistent among skus
@@ -257,136 +258,11 @@ def scrape(output_file, input_file=None):
 
                     instances[instance_type] = new_attributes
 
-    # Parse ondemand pricing
-    for sku, offers in six.iteritems(data["terms"]["OnDemand"]):
-        for code, offer in six.iteritems(offers):
-            for key, dimension in six.iteritems(offer["priceDimensions"]):
-                # skip these for now
-                if any(
-                    descr in dimension["description"].lower()
-                    for descr in [
-                        "transfer",
-                        "global",
-                        "storage",
-                        "iops",
-                        "requests",
-                        "multi-az",
-                    ]
-                ):
-                    continue
-
-                instance = rds_instances.get(sku)
-                if not instance:
-                    # print(f"WARNING: Received on demand pricing info for unknown sku={sku}")
-                    continue
-
-                if (
-                    instance["region"]
-                    not in instances[instance["instance_type"]]["pricing"]
-                ):
-                    instances[instance["instance_type"]]["pricing"][
-                        instance["region"]
-                    ] = {}
-
-                if instance["storage"] == "Aurora IO Optimization Mode":
-                    instances[instance["instance_type"]]["pricing"][instance["region"]][
-                        "211"
-                    ] = {"ondemand": float(dimension["pricePerUnit"]["USD"])}
-                else:
-                    instances[instance["instance_type"]]["pricing"][instance["region"]][
-                        instance["engineCode"]
-                    ] = {"ondemand": float(dimension["pricePerUnit"]["USD"])}
-
-                # keep this for backwards compatibility, even though it's wrong
-                # (database_engine is not unique, so multiple offerings overlap)
-                instances[instance["instance_type"]]["pricing"][instance["region"]][
-                    instance["database_engine"]
-                ] = {"ondemand": float(dimension["pricePerUnit"]["USD"])}
-
-                # build the list of regions where each instance is available
-                # we have to do a reverse lookup from the regions list
-                l = ""
-                for l, r in regions.items():
-                    if instance["region"] == r:
-                        location = l
-                        break
-                instances[instance["instance_type"]]["regions"][instance["region"]] = l
-
-    reserved_mapping = {
-        "3yr Partial Upfront": "yrTerm3.partialUpfront",
-        "1yr Partial Upfront": "yrTerm1.partialUpfront",
-        "3yr All Upfront": "yrTerm3.allUpfront",
-        "1yr All Upfront": "yrTerm1.allUpfront",
-        "1yr No Upfront": "yrTerm1.noUpfront",
-        "3yr No Upfront": "yrTerm3.noUpfront",
-    }
-
-    # Parse reserved pricing
-    for sku, offers in six.iteritems(data["terms"]["Reserved"]):
-        for code, offer in six.iteritems(offers):
-            for key, dimension in six.iteritems(offer["priceDimensions"]):
-                instance = rds_instances.get(sku)
-                if not instance:
-                    # print(f"WARNING: Received reserved pricing info for unknown sku={sku}")
-                    continue
-
-                # skip multi-az
-                if instance["deploymentOption"] != "Single-AZ":
-                    continue
-
-                region = instance["region"]
-
-                # create a regional hash
-                if region not in instance["pricing"]:
-                    instance["pricing"][region] = {}
-
-                # create a database_engine hash
-                if instance["database_engine"] not in instance["pricing"][region]:
-                    instance["pricing"][region][instance["database_engine"]] = {}
-                if instance["engineCode"] not in instance["pricing"][region]:
-                    instance["pricing"][region][instance["engineCode"]] = {}
-
-                # create a reserved hash
-                if (
-                    "reserved"
-                    not in instances[instance["instance_type"]]["pricing"][
-                        instance["region"]
-                    ][instance["database_engine"]]
-                ):
-                    instances[instance["instance_type"]]["pricing"][instance["region"]][
-                        instance["database_engine"]
-                    ]["reserved"] = {}
-                if (
-                    "reserved"
-                    not in instances[instance["instance_type"]]["pricing"][
-                        instance["region"]
-                    ][instance["engineCode"]]
-                ):
-                    instances[instance["instance_type"]]["pricing"][instance["region"]][
-                        instance["engineCode"]
-                    ]["reserved"] = {}
-
-                reserved_type = "%s %s" % (
-                    offer["termAttributes"]["LeaseContractLength"],
-                    offer["termAttributes"]["PurchaseOption"],
-                )
-
-                instances[instance["instance_type"]]["pricing"][instance["region"]][
-                    instance["engineCode"]
-                ]["reserved"][
-                    "%s-%s"
-                    % (reserved_mapping[reserved_type], dimension["unit"].lower())
-                ] = float(
-                    dimension["pricePerUnit"]["USD"]
-                )
-                instances[instance["instance_type"]]["pricing"][instance["region"]][
-                    instance["database_engine"]
-                ]["reserved"][
-                    "%s-%s"
-                    % (reserved_mapping[reserved_type], dimension["unit"].lower())
-                ] = float(
-                    dimension["pricePerUnit"]["USD"]
-                )
+    for sku, terms in reader.terms("OnDemand"):
+        join.add_ondemand(sku, terms)
+    for sku, terms in reader.terms("Reserved"):
+        join.add_reserved(sku, terms)
+    join.apply(instances, registry)
 
     # Calculate all reserved effective pricings (upfront hourly + hourly price)
     for instance_type, instance in six.iteritems(instances):
@@ -456,9 +332,10 @@ def scrape(output_file, input_file=None):
 
     # write output to file
     encoder.FLOAT_REPR = lambda o: format(o, ".5f")
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    with open(output_file, "w+") as outfile:
-        json.dump(list(instances.values()), outfile, indent=1)
+    json_output.write_instances(output_file, instances.values())
+
+    if versions:
+        versions.record()
 
 
 if __name__ == "__main__":
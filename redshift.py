@@ -1,15 +1,16 @@
 #!/usr/bin/env python
-import requests
-import json
 from json import encoder
 import sys
-from lxml import etree
-from six.moves.urllib import request as urllib2
 
 import six
 from tqdm import tqdm
 
 import ec2
+import docs
+import json_output
+import offer_versions
+import offers
+import regions
 
 
 def add_pretty_names(instances):
@@ -51,19 +52,15 @@ def add_node_parameters(instances):
     cluster_url = (
         "https://docs.aws.amazon.com/redshift/latest/mgmt/working-with-clusters.html"
     )
-    tree = etree.parse(urllib2.urlopen(cluster_url), etree.HTMLParser())
+    document = docs.get(cluster_url)
 
     for table_cnt in [0, 1, 2]:
-        table = tree.xpath('//div[@class="table-contents"]//table')[table_cnt]
-        rows = table.xpath(".//tr[./td]")
-
-        for r in rows:
-            etree.strip_elements(r, "sup")
-            instance_type = etree.tounicode(r[0], method="text").strip()
-            slices = etree.tounicode(r[3], method="text").strip()
-            per_node_storage = etree.tounicode(r[4], method="text").strip()
-            node_range = etree.tounicode(r[5], method="text").strip()
-            storage_cap = etree.tounicode(r[6], method="text").strip()
+        for cells in document.text_rows(table_cnt, strip_tags=("sup",)):
+            instance_type = cells[0]
+            slices = cells[3]
+            per_node_storage = cells[4]
+            node_range = cells[5]
+            storage_cap = cells[6]
 
             if "single-node" in instance_type:
                 instance_type = "ra3.xlplus"
@@ -81,24 +78,28 @@ def add_node_parameters(instances):
             instances[instance_type]["storage_capacity"] = storage_cap
 
 
-def scrape(output_file, input_file=None):
+def scrape(output_file, input_file=None, incremental=False):
+    # skip the scrape if the offer file did not change since the last build
+    versions = None
+    if incremental and not input_file:
+        versions = offer_versions.OfferVersions(output_file, ["AmazonRedshift"])
+        if versions.unchanged():
+            return
+
     # if an argument is given, use that as the path for the json file
-    if input_file:
-        with open(input_file) as json_data:
-            data = json.load(json_data)
-    else:
-        price_index = "https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/AmazonRedshift/current/index.json"
-        index = requests.get(price_index)
-        data = index.json()
+    reader = offers.OfferReader(
+        input_file or offers.offer_url("AmazonRedshift"),
+        product_families=["Compute Instance"],
+    )
 
     caches_instances = {}
     instances = {}
 
     # region mapping, someone thought it was handy not to include the region id's :(
-    regions = ec2.get_region_descriptions()
+    registry = regions.get_registry().copy()
 
     # loop through products, and only fetch available instances for now
-    for sku, product in tqdm(six.iteritems(data["products"])):
+    for sku, product in tqdm(reader.products()):
         if product.get("productFamily", None) == "Compute Instance":
             attributes = product["attributes"]
 
@@ -112,12 +113,10 @@ def scrape(output_file, input_file=None):
                 # at one point this region was local but was upgraded to a standard region
                 # however some SKUs still reference the old region
                 region = "ap-northeast-3"
-                regions[location] = region
-            elif location not in regions.values():
-                region = attributes["regionCode"]
-                regions[location] = region
+                registry.add(location, region)
             else:
-                region = regions[location]
+                region = attributes["regionCode"]
+                registry.add(location, region)
 
             # set the attributes in line with the ec2 index
             attributes["region"] = region
@@ -145,8 +144,8 @@ def scrape(output_file, input_file=None):
                 instances[instance_type] = new_attributes
 
     # Parse ondemand pricing
-    for sku, offers in six.iteritems(data["terms"]["OnDemand"]):
-        for code, offer in six.iteritems(offers):
+    for sku, terms in reader.terms("OnDemand"):
+        for code, offer in six.iteritems(terms):
             for key, dimension in six.iteritems(offer["priceDimensions"]):
                 # skip these types of charges
                 if any(
@@ -178,13 +177,9 @@ def scrape(output_file, input_file=None):
                 }
 
                 # build the list of regions where each instance is available
-                # we have to do a reverse lookup from the regions list
-                l = ""
-                for l, r in regions.items():
-                    if instance["region"] == r:
-                        location = l
-                        break
-                instances[instance["instance_type"]]["regions"][instance["region"]] = l
+                instances[instance["instance_type"]]["regions"][instance["region"]] = (
+                    registry.name(instance["region"], "")
+                )
 
     reserved_mapping = {
         "1yr All Upfront": "yrTerm1.allUpfront",
@@ -196,8 +191,8 @@ def scrape(output_file, input_file=None):
     }
 
     # Parse reserved pricing
-    for sku, offers in six.iteritems(data["terms"]["Reserved"]):
-        for code, offer in six.iteritems(offers):
+    for sku, terms in reader.terms("Reserved"):
+        for code, offer in six.iteritems(terms):
             for key, dimension in six.iteritems(offer["priceDimensions"]):
                 # print()
                 # print()
@@ -287,8 +282,10 @@ def scrape(output_file, input_file=None):
 
     # write output to file
     encoder.FLOAT_REPR = lambda o: format(o, ".5f")
-    with open(output_file, "w+") as outfile:
-        json.dump(list(instances.values()), outfile, indent=1)
+    json_output.write_instances(output_file, instances.values())
+
+    if versions:
+        versions.record()
 
 
 if __name__ == "__main__":
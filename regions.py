@@ -0,0 +1,102 @@
+"""
+Registry of AWS region codes and the location names the Price List uses for them.
+
+Seeded once per process from botocore's endpoints.json (regions) and
+meta/regions_aws.yaml (which also lists local zones and wavelength zones), and
+then looked up in both directions in O(1). Scrapers take a copy() to record the
+locations they discover while parsing an offer file.
+"""
+
+import functools
+import json
+import os
+import re
+
+import yaml
+from pkg_resources import resource_filename
+
+REGIONS_FILE = os.path.join(os.path.dirname(__file__), "meta", "regions_aws.yaml")
+
+MAIN = "main"
+LOCAL_ZONE = "local_zone"
+WAVELENGTH = "wavelength"
+
+
+def canonicalize_location(location, from_pricing_api=True):
+    """Ensure location aligns with one of the names in the registry"""
+    # The pricing API returns locations with the old EU prefix
+    if not from_pricing_api:
+        return re.sub("^Europe", "EU", location)
+    return re.sub("^EU", "Europe", location)
+
+
+@functools.lru_cache(maxsize=None)
+def zone_type(code):
+    """Classify a region code as MAIN, LOCAL_ZONE or WAVELENGTH"""
+    if "wl1" in code or "wl2" in code:
+        return WAVELENGTH
+    # e.g. us-west-2-lax-1a has a second number for the zone
+    if len(re.findall(r"\d+", code)) > 1:
+        return LOCAL_ZONE
+    return MAIN
+
+
+class RegionRegistry(object):
+    def __init__(self):
+        # location name -> code of the botocore regions, as returned by
+        # ec2.get_region_descriptions()
+        self.descriptions = {}
+        self._codes = {}
+        self._names = {}
+
+    def add(self, name, code):
+        """Map name and code to each other unless they are already mapped"""
+        self._codes.setdefault(canonicalize_location(name), code)
+        self._names.setdefault(code, name)
+
+    def code(self, name, default=None):
+        return self._codes.get(canonicalize_location(name), default)
+
+    def name(self, code, default=None):
+        return self._names.get(code, default)
+
+    def names(self):
+        """Copy of the code -> location name mapping"""
+        return dict(self._names)
+
+    def region_names(self):
+        """code -> location name of the botocore regions only"""
+        return {code: name for name, code in self.descriptions.items()}
+
+    def copy(self):
+        registry = RegionRegistry()
+        registry.descriptions = dict(self.descriptions)
+        registry._codes = dict(self._codes)
+        registry._names = dict(self._names)
+        return registry
+
+
+@functools.lru_cache(maxsize=None)
+def get_registry():
+    """The shared, read only registry; copy() it before adding locations"""
+    registry = RegionRegistry()
+
+    # Source: https://github.com/boto/botocore/blob/develop/botocore/data/endpoints.json
+    endpoint_file = resource_filename("botocore", "data/endpoints.json")
+    with open(endpoint_file, "r") as f:
+        endpoints = json.load(f)
+    for partition in endpoints["partitions"]:
+        for region in partition["regions"]:
+            # Skip secret and Chinese regions
+            if "us-iso" not in region and not region.startswith("cn-"):
+                description = partition["regions"][region]["description"]
+                registry.descriptions[description] = region
+    for description, region in registry.descriptions.items():
+        registry.add(description, region)
+
+    # Also knows the local zones and wavelength zones, and spells some regions
+    # differently (Asia-Pacific), which only adds aliases for those
+    with open(REGIONS_FILE, "r") as f:
+        for code, name in yaml.safe_load(f).items():
+            registry.add(name, code)
+    return registry
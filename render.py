@@ -7,13 +7,13 @@ import datetime
 import os
 import copy
 import yaml
-import re
 
 from detail_pages_ec2 import build_detail_pages_ec2
 from detail_pages_rds import build_detail_pages_rds
 from detail_pages_cache import build_detail_pages_cache
 from detail_pages_opensearch import build_detail_pages_opensearch
 from detail_pages_redshift import build_detail_pages_redshift
+from regions import zone_type
 
 
 def network_sort(inst):
@@ -210,12 +210,7 @@ def regions_list(instances):
     for i in instances:
         for r in i["pricing"]:
             try:
-                if "wl1" in r or "wl2" in r:
-                    regions["wavelength"][r] = i["regions"][r]
-                elif len(re.findall(r"\d+", r)) > 1:
-                    regions["local_zone"][r] = i["regions"][r]
-                else:
-                    regions["main"][r] = i["regions"][r]
+                regions[zone_type(r)][r] = i["regions"][r]
             except KeyError:
                 print(
                     'ERROR: "regions" key not found in instances.json. Run scrape.py.'
@@ -0,0 +1,180 @@
+"""
+Record and replay of the HTTP and AWS API traffic of a build.
+
+With REPLAY_MODE=record every response received through http_cache's session
+and every boto call made by a client from clients.get_client() is saved under
+REPLAY_DIR. With REPLAY_MODE=replay they are served from there instead, without
+network access or AWS credentials, optionally after REPLAY_LATENCY seconds to
+simulate the network. A request that was not recorded raises ReplayMiss.
+
+HTTP requests are recorded without their conditional and range headers, so a
+recording always holds the full body and replays the same whatever the state of
+the HTTP cache or download directory. Boto calls are keyed by service, region,
+operation and parameters, so every page of a paginated call has its own entry.
+Parameters holding a date or time are not part of the key, so calls asking for
+e.g. the prices as of now replay whenever they run.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import time
+
+import requests.adapters
+import urllib3
+
+REPLAY_MODE = os.getenv("REPLAY_MODE", "")
+REPLAY_DIR = os.getenv("REPLAY_DIR", os.path.join(".cache", "replay"))
+REPLAY_LATENCY = float(os.getenv("REPLAY_LATENCY", "0"))
+CHUNK_SIZE = 1024 * 1024
+
+if REPLAY_MODE not in ("", "record", "replay"):
+    raise ValueError(
+        "REPLAY_MODE must be record, replay or empty, not {!r}".format(REPLAY_MODE)
+    )
+
+# Request headers that make the response depend on local state
+STRIPPED_HEADERS = ("If-None-Match", "If-Modified-Since", "Range", "If-Range")
+
+
+class ReplayMiss(Exception):
+    pass
+
+
+def _key(*parts):
+    data = json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def _path(kind, key):
+    return os.path.join(REPLAY_DIR, kind, key[:2], key + ".pickle")
+
+
+def _save(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+
+def _load(path, what):
+    if REPLAY_LATENCY:
+        time.sleep(REPLAY_LATENCY)
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        raise ReplayMiss("No recording of {} in {}".format(what, REPLAY_DIR))
+
+
+class ReplayAdapter(requests.adapters.HTTPAdapter):
+    """Transport adapter recording or replaying the responses it handles"""
+
+    def send(self, request, stream=False, timeout=None, verify=True, **kwargs):
+        for header in STRIPPED_HEADERS:
+            request.headers.pop(header, None)
+        path = _path("http", _key(request.method, request.url))
+        body_path = path + ".body"
+
+        if REPLAY_MODE == "replay":
+            recording = _load(path, "{} {}".format(request.method, request.url))
+        else:
+            response = super(ReplayAdapter, self).send(
+                request, stream=True, timeout=timeout, verify=verify, **kwargs
+            )
+            # Spool the body as it came over the wire, still content-encoded,
+            # offer files are too large to hold in memory
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with response, open(body_path + ".tmp", "wb") as f:
+                for chunk in response.raw.stream(CHUNK_SIZE, decode_content=False):
+                    f.write(chunk)
+            os.replace(body_path + ".tmp", body_path)
+            recording = {
+                "status": response.status_code,
+                "reason": response.reason,
+                "headers": dict(response.headers),
+            }
+            _save(path, recording)
+
+        raw = urllib3.HTTPResponse(
+            body=open(body_path, "rb"),
+            headers=recording["headers"],
+            status=recording["status"],
+            reason=recording["reason"],
+            preload_content=False,
+            decode_content=False,
+        )
+        response = self.build_response(request, raw)
+        if not stream:
+            # Read the body now, like requests does, which also closes the file
+            response.content
+        return response
+
+
+def http_adapter(**kwargs):
+    """The transport adapter for http_cache's session"""
+    if REPLAY_MODE:
+        return ReplayAdapter(**kwargs)
+    return requests.adapters.HTTPAdapter(**kwargs)
+
+
+class _RecordedHTTPResponse(object):
+    """Stands in for botocore's AWSResponse of a replayed call"""
+
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = b""
+
+
+def _boto_key(params, model, context, **kwargs):
+    # Leave out times like the StartTime=datetime.now() of the spot price
+    # history, they differ on every run
+    params = {
+        name: value
+        for name, value in params.items()
+        if not isinstance(value, (datetime.date, datetime.time))
+    }
+    context["replay_key"] = _key(
+        model.service_model.service_name,
+        context.get("client_region"),
+        model.name,
+        params,
+    )
+
+
+def _record_boto_call(
+    http_response=None, parsed=None, model=None, context=None, **kwargs
+):
+    _save(
+        _path("boto", context["replay_key"]),
+        {
+            "status": http_response.status_code,
+            "headers": dict(http_response.headers),
+            "parsed": parsed,
+        },
+    )
+
+
+def _replay_boto_call(model=None, context=None, **kwargs):
+    recording = _load(
+        _path("boto", context["replay_key"]),
+        "{}.{} in {}".format(
+            model.service_model.service_name, model.name, context.get("client_region")
+        ),
+    )
+    http_response = _RecordedHTTPResponse(recording["status"], recording["headers"])
+    return http_response, recording["parsed"]
+
+
+def watch_client(client):
+    """Record or replay the calls of a boto3 client, according to REPLAY_MODE"""
+    if not REPLAY_MODE:
+        return
+    client.meta.events.register("before-parameter-build", _boto_key)
+    if REPLAY_MODE == "replay":
+        client.meta.events.register("before-call", _replay_boto_call)
+    else:
+        client.meta.events.register("after-call", _record_boto_call)
@@ -2,12 +2,20 @@
 from lxml import etree
 import re
 import json
+import json_output
+import operator
 import locale
+import checkpoint
 import ec2
-import os
-import requests
-import pickle
-from six.moves.urllib import request as urllib2
+import regions
+import docs
+import http_cache
+import instrument
+import offer_versions
+import stages
+import sys
+from docs import totext
+from concurrent import futures
 
 # Following advice from https://stackoverflow.com/a/1779324/216138
 # The locale must be installed in the system, and it must be one where ',' is
@@ -15,7 +23,75 @@ from six.moves.urllib import request as urllib2
 locale.setlocale(locale.LC_ALL, "en_US.UTF-8")
 
 
+# Instance types without IPv6 support:
+# "IPv6 is supported on all current generation instance types and the
+#  C3, R3, and I2 previous generation instance types."
+#  - https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/instance-types.html
+IPV4_ONLY_FAMILIES = frozenset(
+    ["cg1", "m1", "m3", "c1", "cc2", "g2", "m2", "cr1", "hs1", "t1"]
+)
+
+
 class Instance(object):
+    # Slots instead of a per-instance __dict__: there are thousands of these,
+    # and a typo'd attribute name now fails loudly instead of being dropped
+    __slots__ = (
+        "arch",
+        "api_description",
+        "availability_zones",
+        "base_performance",
+        "burst_minutes",
+        "clock_speed_ghz",
+        "compute_capability",
+        "devices",
+        "drive_size",
+        "ebs_iops",
+        "ebs_max_bandwidth",
+        "ebs_only",
+        "ebs_optimized",
+        "ebs_optimized_by_default",
+        "ebs_throughput",
+        "ebs_as_nvme",
+        "ebs_baseline_throughput",
+        "ebs_baseline_iops",
+        "ebs_baseline_bandwidth",
+        "ECU",
+        "enhanced_networking",
+        "family",
+        "FPGA",
+        "generation",
+        "GPU",
+        "GPU_memory",
+        "GPU_model",
+        "includes_swap_partition",
+        "_instance_type",
+        "intel_avx",
+        "intel_avx2",
+        "intel_avx512",
+        "intel_turbo",
+        "_ipv6_support",
+        "linux_virtualization_types",
+        "memory",
+        "network_performance",
+        "num_drives",
+        "nvme_ssd",
+        "physical_processor",
+        "placement_group_support",
+        "pretty_name",
+        "pricing",
+        "regions",
+        "size",
+        "size_unit",
+        "ssd",
+        "storage_needs_initialization",
+        "trim_support",
+        "_type_prefix",
+        "vCPU",
+        "vpc",
+        "vpc_only",
+        "emr",
+    )
+
     def __init__(self):
         self.arch = []
         self.api_description = None
@@ -30,6 +106,7 @@ class Instance(object):
         self.ebs_max_bandwidth = 0
         self.ebs_only = True
         self.ebs_optimized = False
+        self.ebs_optimized_by_default = False
         self.ebs_throughput = 0
         self.ebs_as_nvme = False
         self.ebs_baseline_throughput = 0
@@ -60,6 +137,7 @@ class Instance(object):
         self.pricing = {}
         self.regions = {}
         self.size = 0
+        self.size_unit = None
         self.ssd = False
         self.storage_needs_initialization = False
         self.trim_support = False
@@ -68,114 +146,148 @@ class Instance(object):
         self.vpc_only = True
         self.emr = False
 
+    @property
+    def instance_type(self):
+        return self._instance_type
+
+    @instance_type.setter
+    def instance_type(self, instance_type):
+        # The fields derived from the type are computed once here
+        self._instance_type = instance_type
+        self._type_prefix = instance_type.split(".")[0]
+        self._ipv6_support = self._type_prefix not in IPV4_ONLY_FAMILIES
+
     def get_type_prefix(self):
         """h1, i3, d2, etc"""
-        return self.instance_type.split(".")[0]
+        return self._type_prefix
 
     def get_ipv6_support(self):
-        """Fancy parsing not needed for ipv6 support.
-
-        "IPv6 is supported on all current generation instance types and the
-         C3, R3, and I2 previous generation instance types."
-         - https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/instance-types.html
+        """Fancy parsing not needed for ipv6 support, see IPV4_ONLY_FAMILIES.
 
         FIXME: This should be a @property, but this project is still Python 2. Yikes!
 
         """
-        ipv4_only_families = (
-            "cg1",
-            "m1",
-            "m3",
-            "c1",
-            "cc2",
-            "g2",
-            "m2",
-            "cr1",
-            "hs1",
-            "t1",
+        return self._ipv6_support
+
+    def get_storage(self):
+        if self.ebs_only:
+            return None
+        return dict(
+            ssd=self.ssd,
+            trim_support=self.trim_support,
+            nvme_ssd=self.nvme_ssd,
+            storage_needs_initialization=self.storage_needs_initialization,
+            includes_swap_partition=self.includes_swap_partition,
+            devices=self.num_drives,
+            size=self.drive_size,
+            size_unit=self.size_unit,
         )
-        return self.get_type_prefix() not in ipv4_only_families
+
+    def fields(self):
+        """Yield the (key, value) pairs of the JSON output, sorted by key"""
+        for key, getter in JSON_FIELDS:
+            yield key, getter(self)
 
     def to_dict(self):
-        d = dict(
-            family=self.family,
-            instance_type=self.instance_type,
-            pretty_name=self.pretty_name,
-            arch=self.arch,
-            vCPU=self.vCPU,
-            GPU=self.GPU,
-            GPU_model=self.GPU_model,
-            GPU_memory=self.GPU_memory,
-            compute_capability=self.compute_capability,
-            FPGA=self.FPGA,
-            ECU=self.ECU,
-            base_performance=self.base_performance,
-            burst_minutes=self.burst_minutes,
-            memory=self.memory,
-            ebs_optimized=self.ebs_optimized,
-            ebs_throughput=self.ebs_throughput,
-            ebs_iops=self.ebs_iops,
-            ebs_as_nvme=self.ebs_as_nvme,
-            ebs_max_bandwidth=self.ebs_max_bandwidth,
-            ebs_baseline_throughput=self.ebs_baseline_throughput,
-            ebs_baseline_iops=self.ebs_baseline_iops,
-            ebs_baseline_bandwidth=self.ebs_baseline_bandwidth,
-            network_performance=self.network_performance,
-            enhanced_networking=self.enhanced_networking,
-            placement_group_support=self.placement_group_support,
-            pricing=self.pricing,
-            vpc=self.vpc,
-            linux_virtualization_types=self.linux_virtualization_types,
-            generation=self.generation,
-            vpc_only=self.vpc_only,
-            ipv6_support=self.get_ipv6_support(),
-            physical_processor=self.physical_processor,
-            clock_speed_ghz=self.clock_speed_ghz,
-            intel_avx=self.intel_avx,
-            intel_avx2=self.intel_avx2,
-            intel_avx512=self.intel_avx512,
-            intel_turbo=self.intel_turbo,
-            emr=self.emr,
-            availability_zones=self.availability_zones,
-            regions=self.regions,
-        )
-        if self.ebs_only:
-            d["storage"] = None
-        else:
-            d["storage"] = dict(
-                ssd=self.ssd,
-                trim_support=self.trim_support,
-                nvme_ssd=self.nvme_ssd,
-                storage_needs_initialization=self.storage_needs_initialization,
-                includes_swap_partition=self.includes_swap_partition,
-                devices=self.num_drives,
-                size=self.drive_size,
-                size_unit=self.size_unit,
-            )
-        return d
+        return dict(self.fields())
 
     def __repr__(self):
         return "<Instance {}>".format(self.instance_type)
 
 
-def sanitize_instance_type(instance_type):
-    """Typos and other bad data are common in the instance type columns for some reason"""
-    # Remove random whitespace
-    instance_type = re.sub(r"\s+", "", instance_type, flags=re.UNICODE)
+# Keys of an instance in instances.json, each with how to get its value, in
+# the order json.dump(sort_keys=True) writes them, see json_output
+JSON_FIELDS = tuple(
+    sorted(
+        [
+            (name, operator.attrgetter(name))
+            for name in (
+                "family",
+                "instance_type",
+                "pretty_name",
+                "arch",
+                "vCPU",
+                "GPU",
+                "GPU_model",
+                "GPU_memory",
+                "compute_capability",
+                "FPGA",
+                "ECU",
+                "base_performance",
+                "burst_minutes",
+                "memory",
+                "ebs_optimized",
+                "ebs_throughput",
+                "ebs_iops",
+                "ebs_as_nvme",
+                "ebs_max_bandwidth",
+                "ebs_baseline_throughput",
+                "ebs_baseline_iops",
+                "ebs_baseline_bandwidth",
+                "network_performance",
+                "enhanced_networking",
+                "placement_group_support",
+                "pricing",
+                "vpc",
+                "linux_virtualization_types",
+                "generation",
+                "vpc_only",
+                "physical_processor",
+                "clock_speed_ghz",
+                "intel_avx",
+                "intel_avx2",
+                "intel_avx512",
+                "intel_turbo",
+                "emr",
+                "availability_zones",
+                "regions",
+            )
+        ]
+        + [
+            ("ipv6_support", Instance.get_ipv6_support),
+            ("storage", Instance.get_storage),
+        ],
+        key=lambda field: field[0],
+    )
+)
 
-    # Correct typos
-    typo_corrections = {
-        "x1.16large": "x1.16xlarge",  # https://github.com/powdahound/ec2instances.info/issues/199
-        "i3.4xlxarge": "i3.4xlarge",  # https://github.com/powdahound/ec2instances.info/issues/227
-        "i3.16large": "i3.16xlarge",  # https://github.com/powdahound/ec2instances.info/issues/227
-        "p4d.2xlarge": "p4d.24xlarge",  # as of 2020-11-15
-    }
-    return typo_corrections.get(instance_type, instance_type)
 
+class InstanceIndex(object):
+    """Instances looked up by type, family prefix and generation.
+
+    Built once per scrape and passed to the stages in place of the instance
+    list, which it iterates like. instance_type and generation are never
+    written by a stage, so the index stays valid while they run.
+    """
+
+    def __init__(self, instances):
+        self.instances = instances
+        self.by_type = {}
+        self.by_family = {}
+        self.by_generation = {}
+        for i in instances:
+            self.by_type[i.instance_type] = i
+            self.by_family.setdefault(i.get_type_prefix(), []).append(i)
+            self.by_generation.setdefault(i.generation, []).append(i)
+
+    @classmethod
+    def of(cls, instances):
+        """Index a list of instances, or return it if it already is an index"""
+        if isinstance(instances, cls):
+            return instances
+        return cls(instances)
+
+    def family(self, prefix):
+        return self.by_family.get(prefix, [])
+
+    def generation(self, generation):
+        return self.by_generation.get(generation, [])
+
+    def __iter__(self):
+        return iter(self.instances)
 
-def totext(elt):
-    s = etree.tostring(elt, method="text", encoding="unicode").strip()
-    return re.sub(r"\*\d$", "", s)
+    def __len__(self):
+        return len(self.instances)
 
 
 def transform_size(size):
@@ -235,12 +347,12 @@ def add_ebs_pricing(imap, data):
                     inst.pricing[region]["ebs"] = col["prices"]["USD"]
 
 
-def add_pricing_info(instances):
+def add_pricing_info(instances, workers=8):
     for i in instances:
         i.pricing = {}
 
-    by_type = {i.instance_type: i for i in instances}
-    ec2.add_pricing(by_type)
+    by_type = InstanceIndex.of(instances).by_type
+    ec2.add_pricing(by_type, workers=workers)
 
     # EBS cost surcharge as per https://aws.amazon.com/ec2/pricing/on-demand/#EBS-Optimized_Instances
     ebs_pricing_url = (
@@ -251,7 +363,10 @@ def add_pricing_info(instances):
 
 
 def fetch_data(url):
-    content = urllib2.urlopen(url).read().decode()
+    return parse_data(http_cache.get(url).decode())
+
+
+def parse_data(content):
     try:
         pricing = json.loads(content)
     except ValueError:
@@ -272,10 +387,8 @@ def add_eni_info(instances):
     # TODO: the tables at this URL have changed but it seems the information is already present in
     # from the DescribeInstanceTypes API so this function could be deprecated
     eni_url = "https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/using-eni.html"
-    tree = etree.parse(urllib2.urlopen(eni_url), etree.HTMLParser())
-    table = tree.xpath('//div[@class="table-contents"]//table')[1]
-    rows = table.xpath(".//tr[./td]")
-    by_type = {i.instance_type: i for i in instances}
+    rows = docs.get(eni_url).rows(1)
+    by_type = InstanceIndex.of(instances).by_type
 
     for r in rows:
         instance_type = etree.tostring(r[0], method="text").strip().decode()
@@ -329,28 +442,27 @@ def add_ebs_info(instances):
 
     """
 
-    def parse_ebs_combined_table(by_type, table):
-        for row in table.xpath("tr"):
-            if row.xpath("th"):
-                continue
-            cols = row.xpath("td")
+    def parse_ebs_combined_table(by_type, document, index):
+        for cols in document.text_rows(
+            index, rows="tr[not(th)]", instance_type_column=0
+        ):
             # remove last character which is a superscript with other info
-            instance_type = sanitize_instance_type(totext(cols[0]))[:-1]
+            instance_type = cols[0][:-1]
 
             if len(cols) == 4:
-                ebs_baseline_bandwidth = locale.atof(totext(cols[1]))
-                ebs_baseline_throughput = locale.atof(totext(cols[2]))
-                ebs_baseline_iops = locale.atof(totext(cols[3]))
-                ebs_max_bandwidth = locale.atof(totext(cols[1]))
-                ebs_throughput = locale.atof(totext(cols[2]))
-                ebs_iops = locale.atof(totext(cols[3]))
+                ebs_baseline_bandwidth = locale.atof(cols[1])
+                ebs_baseline_throughput = locale.atof(cols[2])
+                ebs_baseline_iops = locale.atof(cols[3])
+                ebs_max_bandwidth = locale.atof(cols[1])
+                ebs_throughput = locale.atof(cols[2])
+                ebs_iops = locale.atof(cols[3])
             elif len(cols) == 7:
-                ebs_baseline_bandwidth = locale.atof(totext(cols[1]))
-                ebs_max_bandwidth = locale.atof(totext(cols[2]))
-                ebs_baseline_throughput = locale.atof(totext(cols[3]))
-                ebs_throughput = locale.atof(totext(cols[4]))
-                ebs_baseline_iops = locale.atof(totext(cols[5]))
-                ebs_iops = locale.atof(totext(cols[6]))
+                ebs_baseline_bandwidth = locale.atof(cols[1])
+                ebs_max_bandwidth = locale.atof(cols[2])
+                ebs_baseline_throughput = locale.atof(cols[3])
+                ebs_throughput = locale.atof(cols[4])
+                ebs_baseline_iops = locale.atof(cols[5])
+                ebs_iops = locale.atof(cols[6])
 
             if instance_type not in by_type:
                 print(f"ERROR: Ignoring EBS info for unknown instance {instance_type}")
@@ -364,16 +476,15 @@ def add_ebs_info(instances):
                 by_type[instance_type].ebs_iops = ebs_iops
                 by_type[instance_type].ebs_max_bandwidth = ebs_max_bandwidth
 
-    def parse_ebs_nondefault_table(by_type, table):
-        for row in table.xpath("tr"):
-            if row.xpath("th"):
-                continue
-            cols = row.xpath("td")
+    def parse_ebs_nondefault_table(by_type, document, index):
+        for cols in document.text_rows(
+            index, rows="tr[not(th)]", instance_type_column=0
+        ):
             # remove last character which is a superscript with other info
-            instance_type = sanitize_instance_type(totext(cols[0]))[:-1]
-            ebs_max_bandwidth = locale.atof(totext(cols[1]))
-            ebs_throughput = locale.atof(totext(cols[2]))
-            ebs_iops = locale.atof(totext(cols[3]))
+            instance_type = cols[0][:-1]
+            ebs_max_bandwidth = locale.atof(cols[1])
+            ebs_throughput = locale.atof(cols[2])
+            ebs_iops = locale.atof(cols[3])
 
             if instance_type not in by_type:
                 print(f"ERROR: Ignoring EBS info for unknown instance {instance_type}")
@@ -385,16 +496,15 @@ def add_ebs_info(instances):
                 by_type[instance_type].ebs_iops = ebs_iops
                 by_type[instance_type].ebs_max_bandwidth = ebs_max_bandwidth
 
-    by_type = {i.instance_type: i for i in instances}
+    by_type = InstanceIndex.of(instances).by_type
     # Canonical URL for this info is https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/ebs-optimized.html
     # ebs_url = "https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/ebs-optimized.partial.html"
     ebs_url = "https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/ebs-optimized.html"
-    tree = etree.parse(urllib2.urlopen(ebs_url), etree.HTMLParser())
-    tables = tree.xpath('//div[@class="table-contents"]//table')
+    document = docs.get(ebs_url)
     for t in [0, 1, 2, 3, 4]:
-        parse_ebs_combined_table(by_type, tables[t])
+        parse_ebs_combined_table(by_type, document, t)
 
-    parse_ebs_nondefault_table(by_type, tables[5])
+    parse_ebs_nondefault_table(by_type, document, 5)
 
 
 def add_linux_ami_info(instances):
@@ -404,11 +514,10 @@ def add_linux_ami_info(instances):
     given its own column.
 
     """
+    index = InstanceIndex.of(instances)
     checkmark_char = "\u2713"
     url = "http://aws.amazon.com/amazon-linux-ami/instance-type-matrix/"
-    tree = etree.parse(urllib2.urlopen(url), etree.HTMLParser())
-    table = tree.xpath('//div[@class="aws-table"]/table')[0]
-    rows = table.xpath(".//tr[./td]")[1:]  # ignore header
+    rows = docs.get(url).rows(0, '//div[@class="aws-table"]/table')[1:]  # ignore header
 
     for r in rows:
         supported_types = []
@@ -428,10 +537,8 @@ def add_linux_ami_info(instances):
             print("Exception while parsing AMI info for {}: {}".format(family_id, e))
 
         # Apply types for this instance family to all matching instances
-        for i in instances:
-            i_family_id = i.instance_type.split(".")[0]
-            if i_family_id == family_id:
-                i.linux_virtualization_types = supported_types
+        for i in index.family(family_id):
+            i.linux_virtualization_types = supported_types
 
     # http://aws.amazon.com/amazon-linux-ami/instance-type-matrix/ page is
     # missing info about both older (t1, m1, c1, m2) and newer exotic (cg1,
@@ -439,12 +546,12 @@ def add_linux_ami_info(instances):
 
     # Adding "manual" info about older generations
     # Some background info at https://github.com/powdahound/ec2instances.info/pull/161
-    for i in instances:
-        i_family_id = i.instance_type.split(".")[0]
-        if i_family_id in ("cc2", "cg1", "hi1", "hs1"):
+    for family_id in ("cc2", "cg1", "hi1", "hs1"):
+        for i in index.family(family_id):
             if not "HVM" in i.linux_virtualization_types:
                 i.linux_virtualization_types.append("HVM")
-        if i_family_id in ("t1", "m1", "m2", "c1", "hi1", "hs1"):
+    for family_id in ("t1", "m1", "m2", "c1", "hi1", "hs1"):
+        for i in index.family(family_id):
             if not "PV" in i.linux_virtualization_types:
                 i.linux_virtualization_types.append("PV")
 
@@ -467,21 +574,22 @@ def add_vpconly_detail(instances):
         "i2",
         "g2",
     )
-    for i in instances:
-        for family in classic_families:
-            if i.instance_type.startswith(family):
+    index = InstanceIndex.of(instances)
+    for family, family_instances in index.by_family.items():
+        if family.startswith(classic_families):
+            for i in family_instances:
                 i.vpc_only = False
 
 
 def add_instance_storage_details(instances):
     """Add information about instance storage features."""
 
+    index = InstanceIndex.of(instances)
     url = "https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/instance-store-volumes.html"
-    tree = etree.parse(urllib2.urlopen(url), etree.HTMLParser())
+    document = docs.get(url)
 
     for t in [0, 1, 2, 3, 4]:
-        table = tree.xpath('//div[@class="table-contents"]/table')[t]
-        rows = table.xpath(".//tr[./td]")
+        rows = document.rows(t, '//div[@class="table-contents"]/table')
 
         checkmark_char = "\u2714"
         dagger_char = "\u2020"
@@ -500,30 +608,30 @@ def add_instance_storage_details(instances):
             if instance_type is None:
                 continue
 
-            for i in instances:
-                if i.instance_type == instance_type:
-                    i.ebs_only = True
+            i = index.by_type.get(instance_type)
+            if i is None:
+                continue
 
-                    # Supports "24 x 13,980 GB" and "2 x 1,200 GB (2.4 TB)"
-                    m = re.search(r"(\d+)\s*x\s*([0-9,]+)?\s+(\w{2})?", storage_volumes)
+            i.ebs_only = True
 
-                    if m:
-                        size_unit = "GB"
+            # Supports "24 x 13,980 GB" and "2 x 1,200 GB (2.4 TB)"
+            m = re.search(r"(\d+)\s*x\s*([0-9,]+)?\s+(\w{2})?", storage_volumes)
 
-                        if m.group(3):
-                            size_unit = m.group(3)
+            if m:
+                size_unit = "GB"
 
-                        i.ebs_only = False
-                        i.num_drives = locale.atoi(m.group(1))
-                        i.drive_size = locale.atoi(m.group(2))
-                        i.size_unit = size_unit
-                        i.ssd = "SSD" in storage_type
-                        i.nvme_ssd = "NVMe" in storage_type
-                        i.trim_support = checkmark_char in trim_support
-                        i.storage_needs_initialization = (
-                            checkmark_char in needs_initialization
-                        )
-                        i.includes_swap_partition = dagger_char in storage_volumes
+                if m.group(3):
+                    size_unit = m.group(3)
+
+                i.ebs_only = False
+                i.num_drives = locale.atoi(m.group(1))
+                i.drive_size = locale.atoi(m.group(2))
+                i.size_unit = size_unit
+                i.ssd = "SSD" in storage_type
+                i.nvme_ssd = "NVMe" in storage_type
+                i.trim_support = checkmark_char in trim_support
+                i.storage_needs_initialization = checkmark_char in needs_initialization
+                i.includes_swap_partition = dagger_char in storage_volumes
 
 
 def add_t2_credits(instances):
@@ -532,12 +640,10 @@ def add_t2_credits(instances):
     # url = "https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/burstable-credits-baseline-concepts.partial.html"
     # It seems it's no longer dynamically loaded
     url = "http://docs.aws.amazon.com/AWSEC2/latest/UserGuide/t2-credits-baseline-concepts.html"
-    tree = etree.parse(urllib2.urlopen(url), etree.HTMLParser())
-    table = tree.xpath('//div[@class="table-contents"]//table')[1]
-    rows = table.xpath(".//tr[./td]")
+    rows = docs.get(url).rows(1)
     assert len(rows) > 0, "Failed to find T2 CPU credit info"
 
-    by_type = {i.instance_type: i for i in instances}
+    by_type = InstanceIndex.of(instances).by_type
 
     for r in rows:
         if len(r) > 1:
@@ -613,7 +719,7 @@ def add_emr_info(instances):
     url = "https://b0.p.awsstatic.com/pricing/2.0/meteredUnitMaps/elasticmapreduce/USD/current/elasticmapreduce.json"
     pricing = fetch_data(url)
 
-    region_map = {value: key for key, value in ec2.get_region_descriptions().items()}
+    region_map = regions.get_registry().region_names()
 
     emr_prices = {}
     for region in pricing["regions"]:
@@ -1035,7 +1141,7 @@ def add_gpu_info(instances):
         inst.GPU_memory = inst_gpu_data["gpu_memory"]
 
 
-def add_availability_zone_info(instances):
+def add_availability_zone_info(instances, workers=8):
     """
     Add info about availability zones using information from the following APIs:
         - aws ec2 describe-instance-type-offerings --region us-east-1
@@ -1043,24 +1149,29 @@ def add_availability_zone_info(instances):
         - aws ec2 describe-availability-zones --region us-east-1
     https://docs.aws.amazon.com/cli/latest/reference/ec2/describe-instance-type-offerings.html
     """
-    instance_type_region_availability_zones = {}
-    for region_name in ec2.describe_regions():
+
+    def region_offerings(region_name):
+        zone_ids = {}
         for offering in ec2.describe_instance_type_offerings(
             region_name=region_name, location_type="availability-zone-id"
         ):
-            instance_type = offering["InstanceType"]
-            availability_zone_id = offering["Location"]
-            region_availability_zones = instance_type_region_availability_zones.get(
-                instance_type, {}
+            zone_ids.setdefault(offering["InstanceType"], set()).add(
+                offering["Location"]
             )
-            availability_zones = region_availability_zones.get(region_name, [])
-            if availability_zone_id not in availability_zones:
-                availability_zones.append(availability_zone_id)
-                availability_zones.sort()
-                region_availability_zones[region_name] = availability_zones
-                instance_type_region_availability_zones[instance_type] = (
-                    region_availability_zones
-                )
+        return zone_ids
+
+    # Regions are queried concurrently, the slowest one sets the pace
+    region_names = list(ec2.describe_regions())
+    with futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        offerings = pool.map(region_offerings, region_names)
+
+    instance_type_region_availability_zones = {}
+    for region_name, zone_ids in zip(region_names, offerings):
+        for instance_type, availability_zones in zone_ids.items():
+            region_availability_zones = (
+                instance_type_region_availability_zones.setdefault(instance_type, {})
+            )
+            region_availability_zones[region_name] = sorted(availability_zones)
     for inst in instances:
         inst.availability_zones = instance_type_region_availability_zones.get(
             inst.instance_type, {}
@@ -1093,18 +1204,17 @@ def add_placement_groups(instances):
         ],
     }
 
-    for inst in instances:
+    index = InstanceIndex.of(instances)
+    excpt = placement_group_data["exceptions"]
+    prev_geni = placement_group_data["prev_gen_instances"]
+    prev_genf = placement_group_data["prev_gen_families"]
+    for family, family_instances in index.by_family.items():
+        if family[0:2] in excpt:
+            for inst in family_instances:
+                inst.placement_group_support = False
+    for inst in index.generation("previous"):
         itype = inst.instance_type
-        excpt = placement_group_data["exceptions"]
-        prev_geni = placement_group_data["prev_gen_instances"]
-        prev_genf = placement_group_data["prev_gen_families"]
-        if itype[0:2] in excpt:
-            inst.placement_group_support = False
-        elif (
-            inst.generation == "previous"
-            and itype not in prev_geni
-            and itype[0:2] not in prev_genf
-        ):
+        if itype not in prev_geni and itype[0:2] not in prev_genf:
             inst.placement_group_support = False
 
 
@@ -1112,7 +1222,7 @@ def add_dedicated_info(instances):
     # Dedicated Host is a physical server with EC2 instance capacity fully dedicated to a single customer.
     # We treat it as another type of OS, like RHEL or SUSE.
 
-    region_map = {value: key for key, value in ec2.get_region_descriptions().items()}
+    region_map = regions.get_registry().region_names()
     # Note: AWS GovCloud (US) is us-gov-west-1. This seems to be an exception just for dedicated hosts.
     region_map["us-gov-west-1"] = "AWS GovCloud (US)"
     region_map["us-west-2-lax"] = "US West (Los Angeles)"
@@ -1148,47 +1258,60 @@ def add_dedicated_info(instances):
                 _price = {"ondemand": format_price(dinst["price"]), "reserved": {}}
                 all_pricing[region][dinst["Instance Type"]] = _price
 
-        # All of the reserved pricing is at different URLs
+        # All of the reserved pricing is at different URLs, fetch them as a batch
+        base = f"https://b0.p.awsstatic.com/pricing/2.0/meteredUnitMaps/ec2/USD/current/dedicatedhost-reservedinstance-virtual/"
+        price_files = []
         for region in od_pricing["regions"]:
             for term in ["3 year", "1 year"]:
                 for payment in ["No Upfront", "Partial Upfront", "All Upfront"]:
-                    base = f"https://b0.p.awsstatic.com/pricing/2.0/meteredUnitMaps/ec2/USD/current/dedicatedhost-reservedinstance-virtual/"
                     path = f"{region}/{term}/{payment}/index.json".replace(" ", "%20")
+                    price_files.append((region, term, payment, base + path))
 
-                    try:
-                        pricing = fetch_data(base + path)
-                    except:
-                        print(
-                            "WARNING: Ignoring pricing - dedicated host. region={}, term={}, payment={}".format(
-                                region, term, payment
-                            )
-                        )
-                        continue
-
-                    for instance_description, dinst in pricing["regions"][
-                        region
-                    ].items():
-                        # Similar to get_reserved_pricing in ec2.py the goal is to get the effective hourly rate
-                        # and then the frontend will deal with making it monthly, yearly etc
-                        upfront = 0.0
-                        if "Partial" in payment or "All" in payment:
-                            upfront = float(dinst["riupfront:PricePerUnit"])
-                        inst_type = dinst["Instance Type"]
-                        ondemand = float(dinst["price"])
-                        lease_in_years = int(dinst["LeaseContractLength"][0])
-                        hours_in_term = lease_in_years * 365 * 24
-                        price = float(ondemand) + (float(upfront) / hours_in_term)
-                        translate_ri = reserved_map[
-                            dinst["LeaseContractLength"] + dinst["PurchaseOption"]
-                        ]
-
-                        # Certain instances will not have been created above because they are not available on demand
-                        if inst_type not in all_pricing[region]:
-                            all_pricing[region][inst_type] = {"reserved": {}}
-
-                        all_pricing[region][inst_type]["reserved"][translate_ri] = (
-                            format_price(price)
-                        )
+        results = http_cache.get_many([url for _, _, _, url in price_files])
+        failures = 0
+        for (region, term, payment, url), result in zip(price_files, results):
+            try:
+                if not result.ok:
+                    raise result.error
+                pricing = parse_data(result.body.decode())
+            except Exception as e:
+                failures += 1
+                print(
+                    "WARNING: Ignoring pricing - dedicated host. region={}, term={}, payment={}, error={!r}".format(
+                        region, term, payment, e
+                    )
+                )
+                continue
+
+            for instance_description, dinst in pricing["regions"][region].items():
+                # Similar to get_reserved_pricing in ec2.py the goal is to get the effective hourly rate
+                # and then the frontend will deal with making it monthly, yearly etc
+                upfront = 0.0
+                if "Partial" in payment or "All" in payment:
+                    upfront = float(dinst["riupfront:PricePerUnit"])
+                inst_type = dinst["Instance Type"]
+                ondemand = float(dinst["price"])
+                lease_in_years = int(dinst["LeaseContractLength"][0])
+                hours_in_term = lease_in_years * 365 * 24
+                price = float(ondemand) + (float(upfront) / hours_in_term)
+                translate_ri = reserved_map[
+                    dinst["LeaseContractLength"] + dinst["PurchaseOption"]
+                ]
+
+                # Certain instances will not have been created above because they are not available on demand
+                if inst_type not in all_pricing[region]:
+                    all_pricing[region][inst_type] = {"reserved": {}}
+
+                all_pricing[region][inst_type]["reserved"][translate_ri] = format_price(
+                    price
+                )
+
+        elapsed = [r.elapsed for r in results]
+        print(
+            "Fetched {} dedicated host price files ({} failed), slowest {:.2f}s, total {:.2f}s".format(
+                len(results), failures, max(elapsed, default=0), sum(elapsed)
+            )
+        )
 
         return all_pricing
 
@@ -1232,10 +1355,9 @@ def add_spot_interrupt_info(instances):
     """
     os_keys = (("Windows", "mswin"), ("Linux", "linux"))
     freq = ["<5%", "5-10%", "10-15%", "15-20%", ">20%"]
-    response = requests.get(
+    data = fetch_data(
         "https://spot-bid-advisor.s3.amazonaws.com/spot-advisor-data.json"
     )
-    data = response.json()
     spot_advisor = data["spot_advisor"]
     spot_interrupt = {}
     for region, regional_data in spot_advisor.items():
@@ -1273,49 +1395,162 @@ def add_spot_interrupt_info(instances):
                     instance.pricing[region][os_id]["spot_avg"] = f"{est_spot:.6f}"
 
 
-def scrape(data_file):
-    """Scrape AWS to get instance data"""
+# Enrichment stages applied to the instances returned by ec2.get_instances(),
+# with the instance fields each of them reads and writes. Stages that don't
+# touch the same fields run concurrently, see stages.run_stages().
+STAGES = [
+    stages.Stage(
+        add_pricing_info,
+        "Parsing pricing info...",
+        reads=["instance_type"],
+        writes=["pricing", "regions"],
+    ),
+    stages.Stage(
+        add_eni_info,
+        "Parsing ENI info...",
+        reads=["instance_type", "vpc"],
+        writes=["vpc"],
+    ),
+    stages.Stage(
+        add_ebs_info,
+        "Parsing EBS info...",
+        reads=["instance_type"],
+        writes=[
+            "ebs_optimized",
+            "ebs_optimized_by_default",
+            "ebs_baseline_throughput",
+            "ebs_baseline_iops",
+            "ebs_baseline_bandwidth",
+            "ebs_throughput",
+            "ebs_iops",
+            "ebs_max_bandwidth",
+        ],
+    ),
+    stages.Stage(
+        add_linux_ami_info,
+        "Parsing Linux AMI info...",
+        reads=["instance_type"],
+        writes=["linux_virtualization_types"],
+    ),
+    stages.Stage(
+        add_vpconly_detail,
+        "Parsing VPC-only info...",
+        reads=["instance_type"],
+        writes=["vpc_only"],
+    ),
+    stages.Stage(
+        add_instance_storage_details,
+        "Parsing local instance storage...",
+        reads=["instance_type"],
+        writes=[
+            "ebs_only",
+            "num_drives",
+            "drive_size",
+            "size_unit",
+            "ssd",
+            "nvme_ssd",
+            "trim_support",
+            "storage_needs_initialization",
+            "includes_swap_partition",
+        ],
+    ),
+    stages.Stage(
+        add_t2_credits,
+        "Parsing burstable instance credits...",
+        reads=["instance_type", "vCPU"],
+        writes=["base_performance", "burst_minutes"],
+    ),
+    stages.Stage(
+        add_pretty_names,
+        "Parsing instance names...",
+        reads=["instance_type"],
+        writes=["pretty_name"],
+    ),
+    stages.Stage(
+        add_emr_info,
+        "Parsing emr details...",
+        reads=["instance_type", "pricing"],
+        writes=["pricing", "emr"],
+    ),
+    stages.Stage(
+        add_gpu_info,
+        "Adding GPU details...",
+        reads=["instance_type", "GPU"],
+        writes=["GPU", "GPU_model", "compute_capability", "GPU_memory"],
+    ),
+    stages.Stage(
+        add_availability_zone_info,
+        "Adding availability zone details...",
+        reads=["instance_type"],
+        writes=["availability_zones"],
+    ),
+    stages.Stage(
+        add_placement_groups,
+        "Adding placement group details...",
+        reads=["instance_type", "generation"],
+        writes=["placement_group_support"],
+    ),
+    stages.Stage(
+        add_dedicated_info,
+        "Adding dedicated host pricing...",
+        reads=["instance_type", "pricing"],
+        writes=["pricing", "regions"],
+    ),
+    stages.Stage(
+        add_spot_interrupt_info,
+        "Adding spot interrupt details...",
+        reads=["instance_type", "pricing"],
+        writes=["pricing"],
+    ),
+]
+
+
+def scrape(data_file, workers=8, resume=False, incremental=False):
+    """Scrape AWS to get instance data
+
+    The instance list and every stage are checkpointed when they complete, and
+    the checkpoints removed once the scrape succeeds. With resume, the instance
+    list and the stages whose inputs did not change since they were
+    checkpointed are restored instead of run again, so a failed scrape picks
+    up from the stage that failed. With incremental, the scrape is skipped if
+    the EC2 offer did not change since data_file was written. workers bounds
+    the stages running at once and the regions each of them queries at once.
+    """
+    versions = None
+    if incremental:
+        versions = offer_versions.OfferVersions(data_file, ["AmazonEC2"])
+        if versions.unchanged():
+            return
+
+    checkpoints = checkpoint.Checkpoints(resume=resume)
     print("Parsing instance types...")
-    all_instances = ec2.get_instances()
-    print("Parsing pricing info...")
-    add_pricing_info(all_instances)
-    print("Parsing ENI info...")
-    add_eni_info(all_instances)
-    print("Parsing EBS info...")
-    add_ebs_info(all_instances)
-    print("Parsing Linux AMI info...")
-    add_linux_ami_info(all_instances)
-    print("Parsing VPC-only info...")
-    add_vpconly_detail(all_instances)
-    print("Parsing local instance storage...")
-    add_instance_storage_details(all_instances)
-    print("Parsing burstable instance credits...")
-    add_t2_credits(all_instances)
-    print("Parsing instance names...")
-    add_pretty_names(all_instances)
-    print("Parsing emr details...")
-    add_emr_info(all_instances)
-    print("Adding GPU details...")
-    add_gpu_info(all_instances)
-    print("Adding availability zone details...")
-    add_availability_zone_info(all_instances)
-    print("Adding placement group details...")
-    add_placement_groups(all_instances)
-    print("Adding dedicated host pricing...")
-    add_dedicated_info(all_instances)
-    print("Adding spot interrupt details...")
-    add_spot_interrupt_info(all_instances)
-
-    os.makedirs(os.path.dirname(data_file), exist_ok=True)
-    with open(data_file, "w+") as f:
-        json.dump(
-            [i.to_dict() for i in all_instances],
-            f,
-            indent=1,
-            sort_keys=True,
-            separators=(",", ": "),
+    with instrument.stage("get_instances"):
+        all_instances = checkpoints.call("get_instances", ec2.get_instances)
+    index = InstanceIndex(all_instances)
+    # The stages querying every region do so with the same number of workers
+    scrape_stages = [
+        (
+            stage.bind(workers=workers)
+            if stage.func in (add_pricing_info, add_availability_zone_info)
+            else stage
         )
+        for stage in STAGES
+    ]
+    stages.run_stages(
+        scrape_stages, args=(index,), workers=workers, run=checkpoints.run
+    )
+
+    with instrument.stage("write_instances"):
+        json_output.write_instances(data_file, all_instances, sort_keys=True)
+    checkpoints.complete()
+
+    if versions:
+        versions.record()
 
 
 if __name__ == "__main__":
-    scrape("www/instances.json")
+    scrape(
+        "www/instances.json",
+        resume="--resume" in sys.argv[1:],
+        incremental="--incremental" in sys.argv[1:],
+    )
@@ -0,0 +1,127 @@
+"""
+Streaming summary statistics of spot prices.
+
+SpotAggregator keeps min, max, count and mean of the prices it is given, and
+estimates the median and 90th percentile with the P-square algorithm (Jain &
+Chlamtac, 1985), so each observation costs O(1) time and the memory of a cell
+does not grow with the number of prices seen.
+"""
+
+# Observations kept exactly before switching to the estimate. Most cells only
+# see a price per availability zone, so they never get there.
+EXACT_LIMIT = 32
+
+
+class P2Quantile(object):
+    """P-square estimate of the p-quantile of a stream of numbers"""
+
+    def __init__(self, p):
+        self.p = p
+        self.initial = []
+        self.heights = None
+        self.positions = None
+        self.desired = None
+        self.increments = (0.0, p / 2, p, (1 + p) / 2, 1.0)
+
+    def add(self, x):
+        if self.heights is None:
+            self.initial.append(x)
+            if len(self.initial) == EXACT_LIMIT:
+                self._place_markers()
+            return
+
+        q, n = self.heights, self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def _place_markers(self):
+        # Start the five markers at the min, p/2, p, (1+p)/2 quantiles and max
+        # of the exact observations
+        values = sorted(self.initial)
+        self.desired = [1 + (len(values) - 1) * inc for inc in self.increments]
+        self.positions = [int(round(d)) for d in self.desired]
+        self.heights = [values[n - 1] for n in self.positions]
+        self.initial = None
+
+    def _parabolic(self, i, d):
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        if self.heights is not None:
+            return self.heights[2]
+        if not self.initial:
+            return None
+        # Linear interpolation between the closest ranks, like numpy's default
+        values = sorted(self.initial)
+        rank = self.p * (len(values) - 1)
+        lower = int(rank)
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+class SpotAggregator(object):
+    """Summary of the spot prices of one (instance type, region, platform)"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.min_price = None
+        self.max_price = None
+        self.p50 = P2Quantile(0.5)
+        self.p90 = P2Quantile(0.9)
+
+    def add(self, price):
+        """Add a price as returned by the API, a string like "0.012300" """
+        value = float(price)
+        self.count += 1
+        self.total += value
+        # Keep the API strings for min and max so they are published unchanged
+        if self.min is None or value < self.min:
+            self.min, self.min_price = value, price
+        if self.max is None or value >= self.max:
+            self.max, self.max_price = value, price
+        self.p50.add(value)
+        self.p90.add(value)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def summary(self):
+        """The spot_* fields published in an instance's pricing"""
+        return {
+            "spot_min": self.min_price,
+            "spot_max": self.max_price,
+            "spot_count": self.count,
+            "spot_mean": "{:.6f}".format(self.mean),
+            "spot_p50": "{:.6f}".format(self.p50.value()),
+            "spot_p90": "{:.6f}".format(self.p90.value()),
+        }
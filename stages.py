@@ -0,0 +1,88 @@
+"""
+Dependency-aware scheduler for the scrape enrichment stages.
+
+Each Stage declares which instance fields it reads and writes. A stage has to
+wait for every earlier stage (in declaration order) it conflicts with, i.e.
+when either of them writes a field the other one reads or writes. Everything
+else runs concurrently on a bounded thread pool, so the result is the same as
+running the stages one after another in the order they were declared.
+"""
+
+import copy
+import functools
+from concurrent import futures
+
+import instrument
+
+
+class Stage(object):
+    def __init__(self, func, banner, reads=(), writes=()):
+        self.func = func
+        self.name = func.__name__
+        self.banner = banner
+        self.reads = frozenset(reads)
+        self.writes = frozenset(writes)
+
+    def conflicts_with(self, other):
+        return bool(
+            self.writes & (other.reads | other.writes) or self.reads & other.writes
+        )
+
+    def bind(self, **kwargs):
+        """This stage, with kwargs passed to its function"""
+        stage = copy.copy(self)
+        stage.func = functools.partial(self.func, **kwargs)
+        return stage
+
+    def run(self, *args):
+        print(self.banner)
+        with instrument.stage(self.name):
+            return self.func(*args)
+
+    def __repr__(self):
+        return "<Stage {}>".format(self.name)
+
+
+def dependencies(stages):
+    """Map each stage name to the names of the earlier stages it must wait for"""
+    deps = {}
+    for idx, stage in enumerate(stages):
+        deps[stage.name] = [s.name for s in stages[:idx] if stage.conflicts_with(s)]
+    return deps
+
+
+def run_stages(stages, args=(), workers=8, run=None):
+    """Run stages with func(*args), at most `workers` at a time.
+
+    The first exception raised by a stage is re-raised once the stages that
+    were already running have finished. Stages that had not started yet are
+    not run. If given, run(stage, *args) is called instead of stage.run(*args),
+    e.g. to restore the stage from a checkpoint.
+    """
+    if run is None:
+        run = lambda stage, *args: stage.run(*args)
+
+    if workers <= 1:
+        for stage in stages:
+            run(stage, *args)
+        return
+
+    deps = dependencies(stages)
+    pending = list(stages)
+    running = {}
+    done = set()
+    with futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            for stage in list(pending):
+                if all(d in done for d in deps[stage.name]):
+                    pending.remove(stage)
+                    running[pool.submit(run, stage, *args)] = stage
+
+            finished, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    print("ERROR: Stage {} failed: {!r}".format(stage.name, error))
+                    raise error
+                done.add(stage.name)
@@ -21,6 +21,8 @@ from render import render
 from render import build_sitemap
 from render import about_page
 from scrape import scrape
+import instrument
+import profiler
 
 from io import BytesIO
 import gzip
@@ -40,64 +42,82 @@ HTTP_HOST = os.getenv("HTTP_HOST", "127.0.0.1")
 HTTP_PORT = os.getenv("HTTP_PORT", "8080")
 
 
-@task
-def build(c):
+@task(optional=["profile"])
+def build(c, resume=False, incremental=False, profile=None):
     """Scrape AWS sources for data and build the site"""
-    scrape_ec2(c)
-    scrape_rds(c)
-    scrape_cache(c)
-    scrape_redshift(c)
-    scrape_opensearch(c)
-    render_html(c)
-
-
-@task
-def scrape_ec2(c):
+    with profiler.session("build", profile):
+        with instrument.stage("scrape_ec2"):
+            scrape_ec2(c, resume=resume, incremental=incremental)
+        with instrument.stage("scrape_rds"):
+            scrape_rds(c, incremental=incremental)
+        with instrument.stage("scrape_cache"):
+            scrape_cache(c, incremental=incremental)
+        with instrument.stage("scrape_redshift"):
+            scrape_redshift(c, incremental=incremental)
+        with instrument.stage("scrape_opensearch"):
+            scrape_opensearch(c, incremental=incremental)
+        with instrument.stage("render_html"):
+            render_html(c)
+
+        print("Build report written to {}".format(instrument.write_report()))
+        instrument.print_summary()
+
+
+@task(optional=["profile"])
+def scrape_ec2(c, resume=False, incremental=False, profile=None):
     """Scrape EC2 data from AWS and save to local file"""
     ec2_file = "www/instances.json"
     try:
-        scrape(ec2_file)
+        with profiler.session("scrape_ec2", profile):
+            scrape(ec2_file, resume=resume, incremental=incremental)
     except Exception as e:
         print("ERROR: Unable to scrape EC2 data")
         print(traceback.print_exc())
 
 
-@task
-def scrape_rds(c):
+@task(optional=["profile"])
+def scrape_rds(c, incremental=False, profile=None):
     """Scrape RDS data from AWS and save to local file"""
     rds_file = "www/rds/instances.json"
     try:
-        rds_scrape(rds_file)
+        with profiler.session("scrape_rds", profile):
+            rds_scrape(rds_file, incremental=incremental)
     except Exception as e:
         print("ERROR: Unable to scrape RDS data")
         print(traceback.print_exc())
 
 
-def scrape_cache(c):
+@task(optional=["profile"])
+def scrape_cache(c, incremental=False, profile=None):
     """Scrape Cache instance data from AWS and save to local file"""
     cache_file = "www/cache/instances.json"
     try:
-        cache_scrape(cache_file)
+        with profiler.session("scrape_cache", profile):
+            cache_scrape(cache_file, incremental=incremental)
     except Exception as e:
         print("ERROR: Unable to scrape Cache data")
         print(traceback.print_exc())
 
 
-def scrape_redshift(c):
+@task(optional=["profile"])
+def scrape_redshift(c, incremental=False, profile=None):
     """Scrape Redshift instance data from AWS and save to local file"""
     redshift_file = "www/redshift/instances.json"
     try:
-        redshift_scrape(redshift_file)
+        with profiler.session("scrape_redshift", profile):
+            redshift_scrape(redshift_file, incremental=incremental)
     except Exception as e:
         print("ERROR: Unable to scrape Redshift data")
         print(traceback.print_exc())
 
 
-def scrape_opensearch(c):
+@task(optional=["profile"])
+def scrape_opensearch(c, incremental=False, profile=None):
     """Scrape OpenSearch instance data from AWS and save to local file"""
     opensearch_file = "www/opensearch/instances.json"
     try:
-        opensearch_scrape(opensearch_file)
+        with profiler.session("scrape_opensearch", profile):
+            opensearch_scrape(opensearch_file, incremental=incremental)
     except Exception as e:
         print("ERROR: Unable to scrape OpenSearch data")
         print(traceback.print_exc())
@@ -129,33 +149,45 @@ def serve(c):
     httpd.serve_forever()
 
 
-@task
-def render_html(c):
+def _timed_render(data_file, template_file, destination_file):
+    with instrument.stage("render " + destination_file):
+        return render(data_file, template_file, destination_file)
+
+
+@task(optional=["profile"])
+def render_html(c, profile=None):
     """Render HTML but do not update data from Amazon"""
-    sitemap = []
-    sitemap.extend(render("www/instances.json", "in/index.html.mako", "www/index.html"))
-    sitemap.extend(
-        render("www/rds/instances.json", "in/rds.html.mako", "www/rds/index.html")
-    )
-    sitemap.extend(
-        render("www/cache/instances.json", "in/cache.html.mako", "www/cache/index.html")
-    )
-    sitemap.extend(
-        render(
-            "www/redshift/instances.json",
-            "in/redshift.html.mako",
-            "www/redshift/index.html",
+    with profiler.session("render_html", profile):
+        sitemap = []
+        sitemap.extend(
+            _timed_render("www/instances.json", "in/index.html.mako", "www/index.html")
         )
-    )
-    sitemap.extend(
-        render(
-            "www/opensearch/instances.json",
-            "in/opensearch.html.mako",
-            "www/opensearch/index.html",
+        sitemap.extend(
+            _timed_render(
+                "www/rds/instances.json", "in/rds.html.mako", "www/rds/index.html"
+            )
         )
-    )
-    sitemap.append(about_page())
-    build_sitemap(sitemap)
+        sitemap.extend(
+            _timed_render(
+                "www/cache/instances.json", "in/cache.html.mako", "www/cache/index.html"
+            )
+        )
+        sitemap.extend(
+            _timed_render(
+                "www/redshift/instances.json",
+                "in/redshift.html.mako",
+                "www/redshift/index.html",
+            )
+        )
+        sitemap.extend(
+            _timed_render(
+                "www/opensearch/instances.json",
+                "in/opensearch.html.mako",
+                "www/opensearch/index.html",
+            )
+        )
+        sitemap.append(about_page())
+        build_sitemap(sitemap)
 
 
 @task
@@ -178,9 +210,14 @@ def bucket_delete(c):
     print("Bucket %r deleted." % BUCKET_NAME)
 
 
-@task
-def deploy(c, root_dir="www"):
+@task(optional=["profile"])
+def deploy(c, root_dir="www", profile=None):
     """Deploy current content"""
+    with profiler.session("deploy", profile):
+        _deploy(root_dir)
+
+
+def _deploy(root_dir):
     conn = connect_s3(calling_format=BUCKET_CALLING_FORMAT)
     bucket = conn.get_bucket(BUCKET_NAME)
 
@@ -209,8 +246,9 @@ def deploy(c, root_dir="www"):
             k.set_contents_from_file(upload_file, policy="public-read")
 
 
-@task(default=True)
-def update(c):
+@task(default=True, optional=["profile"])
+def update(c, profile=None):
     """Build and deploy the site"""
-    build(c)
-    deploy(c)
+    with profiler.session("update", profile):
+        build(c)
+        deploy(c)